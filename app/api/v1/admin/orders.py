@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/16
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.core.security import get_current_admin_user
+from app.services.shipping_import import ShippingImportService
+
+router = APIRouter()
+
+@router.post("/orders/shipping/import")
+def import_shipping(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """批量发货：上传CSV(表头order_no,shipping_company,shipping_number)或NDJSON，返回逐行错误"""
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv"):
+        fmt = "csv"
+    elif filename.endswith((".ndjson", ".jsonl")):
+        fmt = "ndjson"
+    else:
+        raise HTTPException(status_code=400, detail="Only .csv and .ndjson files are supported")
+
+    service = ShippingImportService(db)
+    return service.import_rows(
+        service.iter_rows(file.file, fmt),
+        operator_id=current_user["id"],
+        operator_name=current_user.get("username")
+    )
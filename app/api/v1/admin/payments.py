@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/20
+
+from fastapi import APIRouter, Depends
+from app.core.http import wechat_http, wechat_cert_http
+from app.core.security import get_current_admin_user
+
+router = APIRouter()
+
+@router.get("/payments/gateway/stats")
+def gateway_stats(current_user: dict = Depends(get_current_admin_user)):
+    """支付网关HTTP连接池和各操作的请求统计"""
+    return [wechat_http.stats(), wechat_cert_http.stats()]
@@ -13,6 +13,10 @@ from app.crud.product import (
 from app.db.session import get_db
 from app.schemas.product import ProductCreate, ProductOut, ProductUpdate
 from app.core.security import get_current_admin_user
+from app.core.elasticsearch import es_service
+from app.core.logging import logger
+from app.services.search import search_cache
+from app.services.search_sync import SearchSyncService
 
 router = APIRouter()
 
@@ -22,6 +26,7 @@ def create_new_product(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
+    # 搜索缓存由增量同步写入ES后发布失效事件
     return create_product(db=db, product=product)
 
 @router.get("/products/", response_model=List[ProductOut])
@@ -45,6 +50,7 @@ def update_existing_product(
     db_product = get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    # 搜索缓存由增量同步写入ES后发布失效事件
     return update_product(db=db, product_id=product_id, product=product)
 
 @router.delete("/products/{product_id}")
@@ -56,5 +62,21 @@ def delete_existing_product(
     db_product = get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    category_id = db_product.category_id
     delete_product(db=db, product_id=product_id)
+    # 物理删除不会出现在增量同步的变更中，直接删除索引；失败时交给增量同步重试
+    try:
+        es_service.delete_product(product_id)
+    except Exception as e:
+        logger.error(f"Failed to delete product {product_id} from index: {str(e)}")
+        try:
+            SearchSyncService(db).mark_failed([product_id])
+        except Exception as e:
+            logger.error(f"Failed to queue index delete for product {product_id}: {str(e)}")
+        return {"detail": "Product deleted successfully"}
+
+    try:
+        search_cache.publish_invalidations([(product_id, category_id)])
+    except Exception as e:
+        logger.warning(f"Failed to publish search cache invalidation: {str(e)}")
     return {"detail": "Product deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/8
+
+from fastapi import APIRouter, Depends
+from app.core.elasticsearch import es_breaker
+from app.core.security import get_current_admin_user
+from app.services.search import search_cache
+
+router = APIRouter()
+
+@router.get("/search/cache/stats")
+def get_search_cache_stats(
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """搜索结果缓存命中统计"""
+    return search_cache.stats()
+
+
+@router.get("/search/breaker/stats")
+def get_search_breaker_stats(
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """ES熔断器状态及切换统计"""
+    return es_breaker.stats()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/12
+
+from decimal import Decimal
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.schemas.seckill import SeckillItemCreate
+from app.services.seckill import SeckillService
+from app.core.security import get_current_admin_user
+
+router = APIRouter()
+
+@router.post("/seckill/items")
+def load_seckill_item(
+    data: SeckillItemCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """开始秒杀：把商品库存配额加载到Redis"""
+    service = SeckillService(db)
+    try:
+        service.load_item(
+            product_id=data.product_id,
+            sku_id=data.sku_id,
+            stock=data.stock,
+            price=Decimal(str(data.price)),
+            limit_per_user=data.limit_per_user
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"detail": "Seckill item loaded successfully"}
+
+@router.delete("/seckill/items/{product_id}")
+def unload_seckill_item(
+    product_id: int,
+    sku_id: Optional[int] = None,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """结束秒杀"""
+    SeckillService().unload_item(product_id, sku_id)
+    return {"detail": "Seckill item unloaded successfully"}
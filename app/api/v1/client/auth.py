@@ -31,5 +31,5 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
@@ -3,17 +3,21 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.crud.order import (
-    create_order, get_orders_by_user, get_order,
+    create_order, get_order,
     cancel_order, request_refund
 )
 from app.db.session import get_db
 from app.schemas.order import OrderCreate, OrderOut
+from app.core.idempotency import idempotency
+from app.core.logging import logger
 from app.core.security import get_current_user
 from app.services.order import OrderService
+from app.services.order_history import OrderHistoryService
+from app.services.order_timeout import OrderTimeoutService
 from app.tasks import process_payment_async
 
 router = APIRouter()
@@ -23,8 +27,10 @@ router = APIRouter()
 def create_new_order(
         order: OrderCreate,
         db: Session = Depends(get_db),
-        current_user: dict = Depends(get_current_user)
+        current_user: dict = Depends(get_current_user),
+        _idempotency=Depends(idempotency("orders:create"))
 ):
+    """创建订单，带Idempotency-Key请求头的重试直接返回首次的结果"""
     order_service = OrderService(db)
     try:
         # 检查库存并创建订单
@@ -32,25 +38,62 @@ def create_new_order(
             user_id=current_user["id"],
             order_data=order
         )
-
-        # 异步处理支付
-        process_payment_async.delay(db_order.id)
-
-        return db_order
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Order creation failed")
 
+    # 订单已提交，之后的失败不能返回错误，否则客户端重试会重复下单
+    try:
+        # 登记支付截止时间，超时未支付自动取消；失败时由backfill补登
+        OrderTimeoutService().schedule([(db_order.id, db_order.created_at)])
+    except Exception as e:
+        logger.error(f"Order {db_order.id} timeout schedule failed: {str(e)}")
+
+    try:
+        # 异步处理支付
+        process_payment_async.delay(db_order.id)
+    except Exception as e:
+        logger.error(f"Order {db_order.id} payment task dispatch failed: {str(e)}")
+
+    return db_order
+
 
 @router.get("/orders/", response_model=List[OrderOut])
 def read_user_orders(
-        skip: int = 0,
-        limit: int = 100,
+        response: Response,
+        before_id: Optional[int] = None,
+        skip: Optional[int] = None,
+        limit: Optional[int] = None,
         db: Session = Depends(get_db),
         current_user: dict = Depends(get_current_user)
 ):
-    return get_orders_by_user(db, user_id=current_user["id"], skip=skip, limit=limit)
+    """订单列表，按before_id游标分页(默认每页20条)，下一页游标在X-Next-Cursor响应头中
+
+    skip为旧版OFFSET分页参数，仅为兼容保留，传入时默认仍为每页100条。
+    """
+    if skip is not None and before_id is None:
+        return OrderHistoryService(db).list_orders_offset(
+            user_id=current_user["id"], skip=skip, limit=limit or 100)
+
+    orders, next_cursor = OrderHistoryService(db).list_orders(
+        user_id=current_user["id"], before_id=before_id, page_size=limit or 20)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return orders
+
+
+@router.get("/orders/{order_id}", response_model=OrderOut)
+def read_user_order(
+        order_id: int,
+        db: Session = Depends(get_db),
+        current_user: dict = Depends(get_current_user)
+):
+    """订单详情，包括已归档的订单"""
+    order = OrderHistoryService(db).get_order(order_id, user_id=current_user["id"])
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
 
 
 @router.post("/orders/{order_id}/cancel")
@@ -65,6 +108,7 @@ def cancel_user_order(
     if order.status not in [0, 1]:  # 只有已提交和待付款的订单可以取消
         raise HTTPException(status_code=400, detail="Order cannot be canceled in current status")
     cancel_order(db, order_id=order_id)
+    OrderTimeoutService().unschedule(order_id)
     return {"detail": "Order canceled successfully"}
 
 
@@ -4,10 +4,14 @@
 # @Date: 2025/5/3
 
 from fastapi import APIRouter, Depends, HTTPException
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 from app.schemas.payment import PaymentCreate, PaymentResult, RefundRequest
 from app.services.payment import PaymentService
+from app.services.payment_callback import PaymentCallbackService
 from app.db.session import get_db
+from app.core.idempotency import idempotency
+from app.core.logging import logger
 from app.core.security import get_current_user
 
 router = APIRouter()
@@ -16,9 +20,10 @@ router = APIRouter()
 def create_payment(
     data: PaymentCreate,
     db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    _idempotency=Depends(idempotency("payments:create"))
 ):
-    """创建支付"""
+    """创建支付，带Idempotency-Key请求头的重试直接返回首次的结果"""
     service = PaymentService(db)
     try:
         result = service.process_payment(data.order_id)
@@ -32,8 +37,19 @@ def payment_callback(
     data: dict,
     db: Session = Depends(get_db)
 ):
-    """支付回调接口(第三方支付平台调用)"""
+    """支付回调接口(第三方支付平台调用)
+
+    验签后写入回调队列立即应答，由后台任务批量处理；队列不可用时同步处理。
+    """
     service = PaymentService(db)
+    if not service.verify_callback_data(data):
+        raise HTTPException(status_code=400, detail="Invalid callback data")
+    try:
+        PaymentCallbackService().enqueue(payment_no, data)
+        return {"status": "success"}
+    except RedisError as e:
+        logger.error(f"Payment callback enqueue failed, processing inline: {str(e)}")
+
     success = service.handle_payment_callback(payment_no, data)
     if success:
         return {"status": "success"}
@@ -3,31 +3,71 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from fastapi import APIRouter, Depends
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from app.core.elasticsearch import async_es_service, es_breaker
+from app.core.logging import logger
 from app.schemas.search import SearchResult
-from app.services.search import SearchService
+from app.services.search import AsyncSearchService
+from app.services.suggest import suggest_service
 from app.db.session import get_db
 
 router = APIRouter()
 
 @router.get("/search", response_model=SearchResult)
-def search_products(
+async def search_products(
     q: str = "",
     category_id: int = None,
     min_price: float = None,
     max_price: float = None,
     page: int = 1,
     page_size: int = 20,
+    cursor: str = None,
+    facets: bool = False,
     db: Session = Depends(get_db)
 ):
-    """搜索商品接口"""
-    service = SearchService(db)
-    return service.search_products(
-        query=q,
-        category_id=category_id,
-        min_price=min_price,
-        max_price=max_price,
-        page=page,
-        page_size=page_size
-    )
\ No newline at end of file
+    """搜索商品接口
+
+    深度翻页时首次传cursor=*，之后传上一页返回的next_cursor。
+    facets=true时同时返回分类、价格区间和SKU属性的分面统计。
+    """
+    service = AsyncSearchService(db)
+    try:
+        result = await service.search_products(
+            query=q,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            page=page,
+            page_size=page_size,
+            cursor=cursor,
+            facets=facets
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 只有返回结果的首页搜索词进入联想
+    if q and page == 1 and cursor is None and result.get("total"):
+        suggest_service.record_query(q)
+    return result
+
+@router.get("/search/suggest", response_model=List[str])
+async def suggest_products(
+    q: str,
+    limit: int = 10
+):
+    """搜索联想接口"""
+    if suggest_service.is_stale():
+        suggest_service.refresh_in_background()
+
+    suggestions = suggest_service.suggest(q, limit)
+    if suggestions:
+        return suggestions
+
+    # 进程内索引未命中时使用ES completion suggester
+    try:
+        return await es_breaker.call_async(async_es_service.suggest_products, q, limit)
+    except Exception as e:
+        logger.warning(f"Suggest error: {str(e)}")
+        return []
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/12
+
+from fastapi import APIRouter, Depends, HTTPException
+from app.schemas.seckill import SeckillReserve, SeckillReservation
+from app.services.seckill import SeckillService, ReservationStatus
+from app.core.security import get_current_user
+
+router = APIRouter()
+
+@router.post("/seckill/{product_id}", response_model=SeckillReservation)
+def reserve(
+    product_id: int,
+    data: SeckillReserve,
+    current_user: dict = Depends(get_current_user)
+):
+    """秒杀抢购，只访问Redis，订单异步生成"""
+    service = SeckillService()
+    try:
+        token = service.reserve(
+            user_id=current_user["id"],
+            product_id=product_id,
+            sku_id=data.sku_id,
+            quantity=data.quantity,
+            address_id=data.address_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"token": token, "status": ReservationStatus.PENDING}
+
+@router.get("/seckill/reservations/{token}", response_model=SeckillReservation)
+def get_reservation(
+    token: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """查询抢购结果"""
+    # 凭证即订单号，按时间递增可被猜测，只返回本人的抢购结果
+    reservation = SeckillService().get_reservation(token)
+    if reservation is None or reservation.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return {"token": token, "status": reservation["status"], "order_id": reservation.get("order_id")}
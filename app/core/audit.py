@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/17
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.operation_log import OperationLog
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditBuffer:
+    """审计日志缓冲写入
+
+    请求线程只把记录放入有界队列(不访问数据库)，后台线程攒够AUDIT_FLUSH_SIZE条或
+    每隔AUDIT_FLUSH_INTERVAL秒用多行INSERT写入一次。队列满时调用方最多等待
+    AUDIT_PUT_TIMEOUT秒，仍然满则在调用方线程直接写入，记录不会被丢弃。
+    只追加、不参与业务事务：业务回滚后已放入的审计记录仍会写入。订单日志需要与
+    状态变更同时提交，仍在业务事务中批量写入，不经过缓冲。
+    """
+
+    def __init__(self, max_size: int = None, flush_size: int = None, flush_interval: float = None):
+        self.max_size = max_size or settings.AUDIT_BUFFER_MAX_SIZE
+        self.flush_size = flush_size or settings.AUDIT_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_FLUSH_INTERVAL
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            # 子进程不继承父进程的后台线程，重新创建队列
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._written = 0
+        self._inline_writes = 0
+        self._failed = 0
+
+    def operation_log(self, operation: str, method: str, path: str, user_id: int = None,
+                      params: str = None, ip: str = None, status_code: int = None, user_agent: str = None,
+                      block: bool = True) -> bool:
+        return self.append(OperationLog, {
+            "user_id": user_id,
+            "operation": operation,
+            "method": method,
+            "path": path,
+            "params": params,
+            "ip": ip,
+            "status_code": status_code,
+            "user_agent": user_agent
+        }, block)
+
+    def append(self, model, record: dict, block: bool = True) -> bool:
+        """放入一条记录
+
+        block为False时不等待也不直接写入，队列满返回False(供事件循环中调用，由调用方
+        转到线程池重试)。
+        """
+        # 写入时间取发生时间，而不是刷盘时间
+        record.setdefault("created_at", datetime.now())
+        if self._closed:
+            if not block:
+                return False
+            self._write([(model, record)])
+            return True
+
+        self._ensure_worker()
+        try:
+            if block:
+                self._queue.put((model, record), timeout=settings.AUDIT_PUT_TIMEOUT)
+            else:
+                self._queue.put_nowait((model, record))
+        except queue.Full:
+            if not block:
+                return False
+            # 背压：后台线程跟不上时由调用方承担写入
+            with self._lock:
+                self._inline_writes += 1
+            self._write([(model, record)])
+        return True
+
+    def flush(self):
+        """把队列中已有的记录全部写入(调用方线程)"""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.flush_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self, timeout: float = 10):
+        """停止后台线程并写入剩余记录(应用关闭时调用)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "max_size": self.max_size,
+            "written": self._written,
+            "inline_writes": self._inline_writes,
+            "failed": self._failed
+        }
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.flush_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list):
+        """按表分组，每张表一条多行INSERT，失败时重试一次后记录到日志"""
+        rows = defaultdict(list)
+        for model, record in batch:
+            rows[model].append(record)
+
+        for attempt in range(2):
+            db = SessionLocal()
+            try:
+                for model, records in rows.items():
+                    db.execute(insert(model), records)
+                db.commit()
+                with self._lock:
+                    self._written += len(batch)
+                return
+            except Exception as e:
+                db.rollback()
+                error = e
+            finally:
+                db.close()
+
+        with self._lock:
+            self._failed += len(batch)
+        logger.error(f"Audit log write failed ({str(error)}), logging {len(batch)} records instead")
+        for model, record in batch:
+            logger.error(f"Audit record {model.__tablename__}: {record}")
+
+
+# 全局实例
+audit_buffer = AuditBuffer()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/8
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """进程内LRU缓存，条目带过期时间，线程安全"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._on_set(key, value)
+
+            while len(self._data) > self.max_size:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0
+            }
+
+    def _remove(self, key):
+        expires_at, value = self._data.pop(key)
+        self._on_remove(key, value)
+
+    def _on_set(self, key, value):
+        """子类钩子：写入条目后调用(持有锁)"""
+
+    def _on_remove(self, key, value):
+        """子类钩子：删除或淘汰条目后调用(持有锁)"""
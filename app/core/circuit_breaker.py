@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/9
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """熔断器
+
+    在滑动窗口内统计失败率和慢调用率，任一超过阈值即打开熔断，
+    open_duration秒后进入半开状态，放行少量探测请求，全部成功则关闭，
+    任一失败或过慢则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_rate_threshold: float = 0.5,
+                 slow_call_duration: float = 0.5,
+                 window_size: int = 50,
+                 minimum_calls: int = 20,
+                 open_duration: float = 10,
+                 half_open_max_calls: int = 3,
+                 ignore_exceptions: tuple = ()):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.ignore_exceptions = ignore_exceptions  # 这些异常不代表下游故障，按成功统计
+
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window_size)  # (是否失败, 是否慢调用)
+        self._opened_at = 0
+        self._half_open_calls = 0
+        self._half_open_successes = 0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.state_changes = {}
+
+    def allow_request(self) -> bool:
+        """是否放行本次调用，放行后必须调用record_success、record_failure或release"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+                self._transition(self.HALF_OPEN)
+
+            if self.state == self.OPEN:
+                self.rejected += 1
+                return False
+
+            if self.state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self._half_open_calls += 1
+
+            return True
+
+    def release(self):
+        """放行的调用没有结果(如协程被取消)，归还半开状态的探测名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self, duration: float):
+        self._record(False, duration >= self.slow_call_duration)
+
+    def record_failure(self, duration: float):
+        self._record(True, duration >= self.slow_call_duration)
+
+    def call(self, func, *args, **kwargs):
+        """通过熔断器调用func，熔断打开时抛出CircuitOpenError"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except self.ignore_exceptions:
+            self.record_success(0)
+            raise
+        except Exception:
+            self.record_failure(time.monotonic() - start)
+            raise
+        except BaseException:
+            # CancelledError等：不计入统计，但必须归还探测名额，否则半开状态无法结束
+            self.release()
+            raise
+
+        self.record_success(time.monotonic() - start)
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        """call的异步版本，func为协程函数"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except self.ignore_exceptions:
+            self.record_success(0)
+            raise
+        except Exception:
+            self.record_failure(time.monotonic() - start)
+            raise
+        except BaseException:
+            # CancelledError等：不计入统计，但必须归还探测名额，否则半开状态无法结束
+            self.release()
+            raise
+
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "calls": self.calls,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "failure_rate": self._rate(0),
+                "slow_call_rate": self._rate(1),
+                "state_changes": dict(self.state_changes)
+            }
+
+    def _record(self, failed: bool, slow: bool):
+        with self._lock:
+            self.calls += 1
+            self.failures += failed
+            self.slow_calls += slow
+
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._transition(self.OPEN)
+                else:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_max_calls:
+                        self._transition(self.CLOSED)
+                return
+
+            if self.state == self.OPEN:
+                # 打开前已放行的调用，结果不再计入窗口
+                return
+
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) >= self.minimum_calls and (
+                    self._rate(0) >= self.failure_rate_threshold or
+                    self._rate(1) >= self.slow_call_rate_threshold):
+                self._transition(self.OPEN)
+
+    def _rate(self, index: int) -> float:
+        if not self._outcomes:
+            return 0
+        return sum(outcome[index] for outcome in self._outcomes) / len(self._outcomes)
+
+    def _transition(self, state: str):
+        change = f"{self.state}->{state}"
+        self.state_changes[change] = self.state_changes.get(change, 0) + 1
+        logger.warning(f"Circuit breaker {self.name}: {change}")
+
+        self.state = state
+        self._outcomes.clear()
+        self._half_open_calls = 0
+        self._half_open_successes = 0
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
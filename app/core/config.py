@@ -23,12 +23,101 @@ class Settings(BaseSettings):
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
 
+    # 订单号/支付流水号生成
+    SNOWFLAKE_WORKER_ID: int = -1  # 固定worker ID(0-1023)，仅单进程部署使用；-1表示从Redis租用
+    SNOWFLAKE_LEASE_TTL: int = 86400  # worker ID租约时间(秒)
+
+    # 支付回调队列
+    PAYMENT_CALLBACK_BATCH_SIZE: int = 200  # 每批处理的回调数
+    PAYMENT_CALLBACK_CONSUME_INTERVAL: int = 1  # 处理任务间隔(秒)
+    PAYMENT_CALLBACK_CLAIM_IDLE: int = 60000  # 未确认多久后由其他消费者认领(毫秒)
+
+    # 支付对账
+    PAYMENT_RECONCILE_AFTER_MINUTES: int = 10  # 创建多久仍未支付的记录参与对账(分钟)
+    PAYMENT_RECONCILE_PAGE_SIZE: int = 200  # 每页查询和提交的记录数
+    PAYMENT_RECONCILE_MAX_PAGES: int = 500  # 每次任务最多处理的页数
+    PAYMENT_RECONCILE_CONCURRENCY: int = 8  # 并发查询数
+    PAYMENT_RECONCILE_RATE: float = 50  # 每秒最多查询次数
+    PAYMENT_RECONCILE_INTERVAL: int = 300  # 对账任务间隔(秒)
+
+    # 对账单核对
+    BILL_RECONCILE_CHUNK_SIZE: int = 2000  # 每次IN查询核对的账单行数
+    BILL_REPORT_DIR: str = "reports"  # 差异报告目录
+
+    # 订单超时取消
+    ORDER_PAYMENT_TIMEOUT_MINUTES: int = 30  # 支付截止时间(分钟)
+    ORDER_TIMEOUT_BATCH_SIZE: int = 500  # 每批取消的订单数
+    ORDER_TIMEOUT_CLAIM_LEASE: int = 300  # 取出后未完成时重新取出的间隔(秒)
+    ORDER_TIMEOUT_INTERVAL: int = 5  # 超时取消任务间隔(秒)
+
+    # 幂等键
+    IDEMPOTENCY_TTL: int = 86400  # 已完成请求的响应保留时间(秒)
+    IDEMPOTENCY_LOCK_TTL: int = 60  # 处理中占位的过期时间(秒)
+
+    # 审计日志缓冲写入
+    AUDIT_BUFFER_MAX_SIZE: int = 10000  # 队列最大条数
+    AUDIT_FLUSH_SIZE: int = 500  # 攒够多少条写入一次
+    AUDIT_FLUSH_INTERVAL: float = 1.0  # 最长写入间隔(秒)
+    AUDIT_PUT_TIMEOUT: float = 0.05  # 队列满时最长等待(秒)，超时后由调用方直接写入
+
+    # 订单归档
+    ORDER_ARCHIVE_AFTER_DAYS: int = 180  # 终态订单创建多少天后归档
+    ORDER_ARCHIVE_CHUNK_SIZE: int = 500  # 每个事务移动的订单数
+    ORDER_ARCHIVE_MAX_CHUNKS: int = 200  # 每次任务最多处理的块数
+    ORDER_ARCHIVE_SLEEP: float = 0.2  # 块之间的休眠(秒)，限制对线上库的压力
+    ORDER_ARCHIVE_INTERVAL: int = 3600  # 归档任务间隔(秒)
+
+    # 批量发货导入
+    SHIPPING_IMPORT_CHUNK_SIZE: int = 1000  # 每块校验和更新的行数
+
+    # 秒杀
+    SECKILL_BATCH_SIZE: int = 200  # 每批生成的订单数
+    SECKILL_CONSUME_INTERVAL: int = 1  # 订单生成任务间隔(秒)
+    SECKILL_RESERVATION_TTL: int = 3600  # 抢购凭证保留时间(秒)
+
     # Celery配置
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/2"
 
     # Elasticsearch配置
     ELASTICSEARCH_URL: str = "http://localhost:9200"
+    ES_NUMBER_OF_REPLICAS: int = 0
+    ES_REFRESH_INTERVAL: str = "1s"
+    ES_BULK_CHUNK_SIZE: int = 500  # 每个_bulk请求的文档数
+    ES_BULK_THREAD_COUNT: int = 4  # 并发中的_bulk请求数
+    ES_REINDEX_FETCH_SIZE: int = 1000  # 全量重建时每次从数据库读取的行数
+    ES_PIT_KEEP_ALIVE: str = "5m"  # 游标翻页point-in-time保留时间
+    ES_SEARCH_TIMEOUT: float = 1.0  # 单次搜索请求超时(秒)
+    ES_MAX_CONNECTIONS: int = 100  # 异步客户端连接池大小
+
+    # ES熔断
+    ES_BREAKER_FAILURE_RATE: float = 0.5  # 失败率阈值
+    ES_BREAKER_SLOW_CALL_RATE: float = 0.5  # 慢调用率阈值
+    ES_BREAKER_SLOW_CALL_DURATION: float = 0.5  # 超过该耗时(秒)视为慢调用
+    ES_BREAKER_WINDOW_SIZE: int = 50  # 滑动窗口调用数
+    ES_BREAKER_MINIMUM_CALLS: int = 20  # 窗口内至少有这么多调用才计算比率
+    ES_BREAKER_OPEN_DURATION: int = 10  # 熔断打开后多久进入半开(秒)
+    ES_BREAKER_HALF_OPEN_CALLS: int = 3  # 半开状态探测请求数
+
+    # 搜索联想
+    SUGGEST_REFRESH_INTERVAL: int = 60  # 前缀索引增量刷新间隔(秒)
+    SUGGEST_MAX_QUERIES: int = 10000  # 进入联想的热门搜索词上限
+    SUGGEST_MIN_QUERY_COUNT: int = 3  # 有结果的搜索累计达到该次数才进入联想
+    SUGGEST_MAX_PENDING_QUERIES: int = 50000  # 两次刷新之间最多统计的不同搜索词数
+
+    # 增量同步
+    SEARCH_SYNC_INTERVAL: int = 5  # 秒
+    SEARCH_SYNC_BATCH_SIZE: int = 500
+    SEARCH_SYNC_LAG_SECONDS: int = 2  # 只同步该时间之前的变更，避免漏掉晚提交的事务
+
+    # 搜索结果缓存
+    SEARCH_CACHE_TTL: int = 30  # 秒
+    SEARCH_CACHE_MAX_SIZE: int = 10000
+    SEARCH_CACHE_INVALIDATION_POLL: float = 1.0  # 读取增量同步发布的失效事件的最小间隔(秒)
+    SEARCH_FACET_CACHE_TTL: int = 60  # 分面统计缓存(秒)，同一筛选条件翻页时复用
+    SEARCH_FACET_SIZE: int = 20  # 每个分面返回的桶数
+    SEARCH_FACET_PRICE_INTERVAL: int = 100  # 价格区间宽度
+    SEARCH_NGRAM_TOKEN_SIZE: int = 1  # 须与MySQL的ngram_token_size一致，更短的词不进入全文索引
 
     # 微信支付配置
     WECHAT_APPID: str = ""
@@ -37,6 +126,16 @@ class Settings(BaseSettings):
     WECHAT_NOTIFY_URL: str = ""
     WECHAT_CERT_PATH: str = ""
     WECHAT_KEY_PATH: str = ""
+    WECHAT_API_BASE: str = "https://api.mch.weixin.qq.com"
+    WECHAT_CREATE_ORDER_TIMEOUT: float = 5.0  # 下单读取超时(秒)
+    WECHAT_QUERY_TIMEOUT: float = 3.0  # 查询读取超时(秒)
+    WECHAT_REFUND_TIMEOUT: float = 10.0  # 退款读取超时(秒)
+    WECHAT_DOWNLOAD_BILL_TIMEOUT: float = 60.0  # 下载对账单每次读取的超时(秒)
+
+    # 支付网关HTTP连接池
+    GATEWAY_POOL_MAXSIZE: int = 50  # 每个网关的最大连接数
+    GATEWAY_CONNECT_TIMEOUT: float = 3.0  # 连接超时(秒)
+    GATEWAY_READ_TIMEOUT: float = 10.0  # 默认读取超时(秒)
 
     # 支付宝配置
     ALIPAY_APPID: str = ""
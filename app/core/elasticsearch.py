@@ -3,95 +3,27 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch, NotFoundError, RequestError
+from elasticsearch.helpers import parallel_bulk
+from app.core.circuit_breaker import CircuitBreaker
 from app.core.config import settings
 from app.models.product import Product
+import base64
+import json
 import logging
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
-class ElasticSearchService:
-    def __init__(self):
-        self.es = Elasticsearch(settings.ELASTICSEARCH_URL)
-        self.index_name = "products"
-
-    def create_index(self):
-        """创建Elasticsearch索引"""
-        if not self.es.indices.exists(index=self.index_name):
-            body = {
-                "settings": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0,
-                    "analysis": {
-                        "analyzer": {
-                            "default": {
-                                "type": "ik_max_word"
-                            }
-                        }
-                    }
-                },
-                "mappings": {
-                    "properties": {
-                        "id": {"type": "keyword"},
-                        "name": {
-                            "type": "text",
-                            "analyzer": "ik_max_word",
-                            "search_analyzer": "ik_smart"
-                        },
-                        "description": {
-                            "type": "text",
-                            "analyzer": "ik_max_word",
-                            "search_analyzer": "ik_smart"
-                        },
-                        "category_id": {"type": "keyword"},
-                        "price": {"type": "float"},
-                        "status": {"type": "integer"},
-                        "attributes": {
-                            "type": "nested",
-                            "properties": {
-                                "name": {"type": "keyword"},
-                                "value": {"type": "keyword"}
-                            }
-                        }
-                    }
-                }
-            }
-            self.es.indices.create(index=self.index_name, body=body)
-            logger.info(f"Created Elasticsearch index: {self.index_name}")
-
-    def index_product(self, product: Product):
-        """索引商品"""
-        doc = {
-            "id": str(product.id),
-            "name": product.name,
-            "description": product.description,
-            "category_id": str(product.category_id) if product.category_id else None,
-            "price": float(product.price),
-            "status": product.status,
-            "attributes": []
-        }
-
-        # 添加SKU属性
-        for sku in product.skus:
-            if sku.attributes:
-                # 假设attributes是JSON字符串，如 {"颜色": "红色", "尺寸": "XL"}
-                attrs = eval(sku.attributes) if isinstance(sku.attributes, str) else sku.attributes
-                for name, value in attrs.items():
-                    doc["attributes"].append({
-                        "name": name,
-                        "value": value
-                    })
-
-        self.es.index(index=self.index_name, id=str(product.id), body=doc)
-        logger.debug(f"Indexed product: {product.id}")
-
-    def search_products(self, query: str, category_id: int = None,
-                        min_price: float = None, max_price: float = None,
-                        page: int = 1, page_size: int = 20):
-        """搜索商品"""
-        start = (page - 1) * page_size
+class SearchQueryBuilder:
+    """同步与异步搜索服务共用的请求构建和结果处理"""
 
+    def build_search_body(self, query: str, category_id: int = None,
+                          min_price: float = None, max_price: float = None,
+                          page_size: int = 20) -> dict:
+        """构建搜索请求体(不含分页)"""
         # 构建查询条件
         must_conditions = []
 
@@ -127,17 +59,17 @@ class ElasticSearchService:
             "term": {"status": 1}
         })
 
-        body = {
+        return {
             "query": {
                 "bool": {
                     "must": must_conditions
                 }
             },
-            "from": start,
             "size": page_size,
             "sort": [
                 {"_score": {"order": "desc"}},
-                {"price": {"order": "asc"}}
+                {"price": {"order": "asc"}},
+                {"id": {"order": "asc"}}  # 保证排序稳定，作为search_after的决胜字段
             ],
             "highlight": {
                 "fields": {
@@ -147,9 +79,62 @@ class ElasticSearchService:
             }
         }
 
-        result = self.es.search(index=self.index_name, body=body)
+    def build_facet_aggs(self) -> dict:
+        """分面统计：分类、价格区间、SKU属性(按商品数计数)"""
+        return {
+            "categories": {
+                "terms": {"field": "category_id", "size": settings.SEARCH_FACET_SIZE}
+            },
+            "price": {
+                "histogram": {
+                    "field": "price",
+                    "interval": settings.SEARCH_FACET_PRICE_INTERVAL,
+                    "min_doc_count": 1
+                }
+            },
+            "attributes": {
+                "nested": {"path": "attributes"},
+                "aggs": {
+                    "names": {
+                        "terms": {"field": "attributes.name", "size": settings.SEARCH_FACET_SIZE},
+                        "aggs": {
+                            "values": {
+                                "terms": {"field": "attributes.value", "size": settings.SEARCH_FACET_SIZE},
+                                "aggs": {
+                                    "products": {"reverse_nested": {}}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+    def build_facets(self, aggregations: dict) -> dict:
+        interval = settings.SEARCH_FACET_PRICE_INTERVAL
+        return {
+            "categories": [
+                {"value": bucket["key"], "count": bucket["doc_count"]}
+                for bucket in aggregations["categories"]["buckets"]
+            ],
+            "price": [
+                {"min_price": bucket["key"], "max_price": bucket["key"] + interval, "count": bucket["doc_count"]}
+                for bucket in aggregations["price"]["buckets"]
+            ],
+            "attributes": [
+                {
+                    "name": name["key"],
+                    "values": [
+                        {"value": value["key"], "count": value["products"]["doc_count"]}
+                        for value in name["values"]["buckets"]
+                    ]
+                }
+                for name in aggregations["attributes"]["names"]["buckets"]
+            ]
+        }
 
-        # 处理结果
+    def build_search_result(self, result: dict, page: int, page_size: int) -> dict:
+        """处理搜索结果"""
         products = []
         for hit in result["hits"]["hits"]:
             source = hit["_source"]
@@ -164,12 +149,315 @@ class ElasticSearchService:
                     "description"] else None
             })
 
-        return {
+        search_result = {
             "total": result["hits"]["total"]["value"],
             "products": products,
             "page": page,
             "page_size": page_size
         }
+        if "aggregations" in result:
+            search_result["facets"] = self.build_facets(result["aggregations"])
+        return search_result
+
+    def build_suggest_body(self, prefix: str, size: int = 10) -> dict:
+        """构建completion suggester请求体"""
+        return {
+            "_source": ["name", "status"],
+            "suggest": {
+                "product_suggest": {
+                    "prefix": prefix,
+                    "completion": {
+                        "field": "suggest",
+                        "size": size,
+                        "skip_duplicates": True
+                    }
+                }
+            }
+        }
+
+    def build_suggest_result(self, result: dict) -> list:
+        options = result["suggest"]["product_suggest"][0]["options"]
+        return [option["_source"]["name"] for option in options
+                if option["_source"].get("status") == 1]
+
+    def next_cursor(self, result: dict, page_size: int):
+        """根据本页结果生成下一页游标，没有更多结果时返回None"""
+        hits = result["hits"]["hits"]
+        if len(hits) < page_size:
+            return None
+        return self.encode_cursor(result["pit_id"], hits[-1]["sort"])
+
+    @staticmethod
+    def encode_cursor(pit_id: str, search_after: list) -> str:
+        """游标对客户端不透明：point-in-time ID和上一页最后一条的排序值"""
+        data = json.dumps({"pit": pit_id, "after": search_after}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    @staticmethod
+    def check_cursor_error(search_after, error: Exception):
+        """客户端传入的游标对应的point-in-time已过期或游标内容无效时抛出ValueError
+
+        只转换续页请求(带search_after)的错误，新开point-in-time时的索引不存在、
+        映射错误等仍按ES故障处理。
+        """
+        if search_after:
+            raise ValueError("Cursor expired, please search again") from error
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        if cursor == "*":
+            return None, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return data["pit"], data["after"]
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+
+class ElasticSearchService(SearchQueryBuilder):
+    def __init__(self):
+        self.es = Elasticsearch(settings.ELASTICSEARCH_URL)
+        self.index_name = "products"
+
+    def index_body(self) -> dict:
+        """索引的settings和mappings"""
+        return {
+            "settings": {
+                "number_of_shards": 1,
+                "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS,
+                "refresh_interval": settings.ES_REFRESH_INTERVAL,
+                "analysis": {
+                    "analyzer": {
+                        "default": {
+                            "type": "ik_max_word"
+                        }
+                    }
+                }
+            },
+            "mappings": {
+                "properties": {
+                    "id": {"type": "keyword"},
+                    "name": {
+                        "type": "text",
+                        "analyzer": "ik_max_word",
+                        "search_analyzer": "ik_smart"
+                    },
+                    "description": {
+                        "type": "text",
+                        "analyzer": "ik_max_word",
+                        "search_analyzer": "ik_smart"
+                    },
+                    "category_id": {"type": "keyword"},
+                    "price": {"type": "float"},
+                    "status": {"type": "integer"},
+                    # 搜索联想的ES侧实现，进程内前缀索引未命中时使用
+                    "suggest": {"type": "completion"},
+                    "attributes": {
+                        "type": "nested",
+                        "properties": {
+                            "name": {"type": "keyword"},
+                            "value": {"type": "keyword"}
+                        }
+                    }
+                }
+            }
+        }
+
+    def create_index(self):
+        """创建Elasticsearch索引
+
+        index_name是别名，实际数据在带版本号的物理索引中，首次部署时创建
+        第一个版本并指向别名。
+        """
+        if not self.es.indices.exists(index=self.index_name):
+            new_index = self.create_versioned_index(bulk_load=False)
+            self.swap_alias(new_index)
+
+    def create_versioned_index(self, bulk_load: bool = True) -> str:
+        """创建带版本号的物理索引
+
+        bulk_load为True时关闭刷新、不建副本，加快批量写入，写完后需调用finish_bulk_load。
+        """
+        new_index = f"{self.index_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        body = self.index_body()
+        if bulk_load:
+            body["settings"]["refresh_interval"] = "-1"
+            body["settings"]["number_of_replicas"] = 0
+        self.es.indices.create(index=new_index, body=body)
+        logger.info(f"Created Elasticsearch index: {new_index}")
+        return new_index
+
+    def finish_bulk_load(self, index: str):
+        """恢复刷新间隔和副本数，等待副本分配完成"""
+        self.es.indices.put_settings(index=index, body={
+            "index": {
+                "refresh_interval": settings.ES_REFRESH_INTERVAL,
+                "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS
+            }
+        })
+        self.es.indices.refresh(index=index)
+        self.es.cluster.health(
+            index=index,
+            wait_for_status="green" if settings.ES_NUMBER_OF_REPLICAS else "yellow",
+            timeout="10m"
+        )
+
+    def get_alias_indices(self) -> list:
+        """别名当前指向的物理索引"""
+        if not self.es.indices.exists_alias(name=self.index_name):
+            return []
+        return list(self.es.indices.get_alias(name=self.index_name).keys())
+
+    def swap_alias(self, new_index: str) -> list:
+        """原子地把别名切换到new_index，返回切换前的物理索引"""
+        old_indices = self.get_alias_indices()
+        actions = [{"remove": {"index": index, "alias": self.index_name}} for index in old_indices]
+
+        # 旧版本直接使用products作为物理索引名，切换时一并删除
+        if not old_indices and self.es.indices.exists(index=self.index_name):
+            actions.append({"remove_index": {"index": self.index_name}})
+
+        actions.append({"add": {"index": new_index, "alias": self.index_name}})
+        self.es.indices.update_aliases(body={"actions": actions})
+        logger.info(f"Switched alias {self.index_name}: {old_indices} -> {new_index}")
+        return old_indices
+
+    def count(self, index: str) -> int:
+        """索引中的文档数"""
+        return self.es.count(index=index)["count"]
+
+    def delete_indices(self, indices: list):
+        for index in indices:
+            self.es.indices.delete(index=index, ignore=[404])
+            logger.info(f"Deleted Elasticsearch index: {index}")
+
+    def build_product_doc(self, product: Product) -> dict:
+        """构建商品索引文档"""
+        doc = {
+            "id": str(product.id),
+            "name": product.name,
+            "description": product.description,
+            "category_id": str(product.category_id) if product.category_id else None,
+            "price": float(product.price),
+            "status": product.status,
+            "suggest": {"input": [product.name], "weight": product.sold_count or 0},
+            "attributes": []
+        }
+
+        # 添加SKU属性
+        for sku in product.skus:
+            if sku.attributes:
+                # 假设attributes是JSON字符串，如 {"颜色": "红色", "尺寸": "XL"}
+                attrs = eval(sku.attributes) if isinstance(sku.attributes, str) else sku.attributes
+                for name, value in attrs.items():
+                    doc["attributes"].append({
+                        "name": name,
+                        "value": value
+                    })
+
+        return doc
+
+    def index_product(self, product: Product):
+        """索引商品"""
+        doc = self.build_product_doc(product)
+        self.es.index(index=self.index_name, id=str(product.id), body=doc)
+        logger.debug(f"Indexed product: {product.id}")
+
+    def build_index_action(self, product: Product, index: str = None) -> dict:
+        """构建批量写入的index动作，index为空时写入别名"""
+        return {
+            "_op_type": "index",
+            "_index": index or self.index_name,
+            "_id": str(product.id),
+            "_source": self.build_product_doc(product)
+        }
+
+    def build_delete_action(self, product_id: int) -> dict:
+        """构建批量写入的delete动作"""
+        return {
+            "_op_type": "delete",
+            "_index": self.index_name,
+            "_id": str(product_id)
+        }
+
+    def bulk(self, actions, chunk_size: int = 500, thread_count: int = 4) -> dict:
+        """通过_bulk接口批量写入，多个批次并发发送
+
+        actions可以是生成器，按chunk_size切分后由thread_count个线程并发提交，
+        内存占用与总量无关。返回成功数、失败数、失败的文档ID和耗时。
+        """
+        success = 0
+        errors = 0
+        failed = []
+        start = time.monotonic()
+
+        for ok, info in parallel_bulk(
+                self.es, actions,
+                thread_count=thread_count,
+                chunk_size=chunk_size,
+                raise_on_error=False,
+                raise_on_exception=False):
+            # 与delete_product一致，删除不存在的文档不算失败
+            if ok or info.get("delete", {}).get("status") == 404:
+                success += 1
+            else:
+                errors += 1
+                failed.append(next(iter(info.values())).get("_id"))
+                logger.warning(f"Bulk action failed: {info}")
+
+        elapsed = time.monotonic() - start
+        return {
+            "success": success,
+            "errors": errors,
+            "failed": failed,
+            "elapsed": elapsed
+        }
+
+    def search_products(self, query: str, category_id: int = None,
+                        min_price: float = None, max_price: float = None,
+                        page: int = 1, page_size: int = 20, cursor: str = None,
+                        facets: bool = False):
+        """搜索商品
+
+        cursor为空时按page分页；cursor为"*"时开启游标翻页，之后传入上一页返回的
+        next_cursor继续，深度翻页与第一页开销相同。
+        facets为True时在同一请求中返回分面统计。
+        """
+        body = self.build_search_body(query, category_id, min_price, max_price, page_size)
+        if facets:
+            body["aggs"] = self.build_facet_aggs()
+
+        if cursor is None:
+            body["from"] = (page - 1) * page_size
+            result = self.es.search(index=self.index_name, body=body,
+                                    request_timeout=settings.ES_SEARCH_TIMEOUT)
+            return self.build_search_result(result, page, page_size)
+
+        pit_id, search_after = self.decode_cursor(cursor)
+        if pit_id is None:
+            pit_id = self.es.open_point_in_time(
+                index=self.index_name, keep_alive=settings.ES_PIT_KEEP_ALIVE,
+                request_timeout=settings.ES_SEARCH_TIMEOUT)["id"]
+        body["pit"] = {"id": pit_id, "keep_alive": settings.ES_PIT_KEEP_ALIVE}
+        if search_after:
+            body["search_after"] = search_after
+
+        try:
+            result = self.es.search(body=body, request_timeout=settings.ES_SEARCH_TIMEOUT)
+        except (NotFoundError, RequestError) as e:
+            self.check_cursor_error(search_after, e)
+            raise
+        search_result = self.build_search_result(result, page, page_size)
+        search_result["next_cursor"] = self.next_cursor(result, page_size)
+        if search_result["next_cursor"] is None:
+            self.close_point_in_time(result["pit_id"])
+        return search_result
+
+    def close_point_in_time(self, pit_id: str):
+        try:
+            self.es.close_point_in_time(body={"id": pit_id})
+        except Exception as e:
+            logger.warning(f"Failed to close point-in-time: {str(e)}")
 
     def delete_product(self, product_id: int):
         """删除商品索引"""
@@ -177,5 +465,85 @@ class ElasticSearchService:
         logger.debug(f"Deleted product index: {product_id}")
 
 
+class AsyncElasticSearchService(SearchQueryBuilder):
+    """基于AsyncElasticsearch的搜索服务，供异步路由使用
+
+    连接由aiohttp连接池复用，并发数受ES_MAX_CONNECTIONS而不是线程池大小限制。
+    """
+
+    def __init__(self):
+        self.es = AsyncElasticsearch(
+            settings.ELASTICSEARCH_URL,
+            maxsize=settings.ES_MAX_CONNECTIONS
+        )
+        self.index_name = "products"
+
+    async def search_products(self, query: str, category_id: int = None,
+                              min_price: float = None, max_price: float = None,
+                              page: int = 1, page_size: int = 20, cursor: str = None,
+                              facets: bool = False):
+        """搜索商品，参数与ElasticSearchService.search_products相同"""
+        body = self.build_search_body(query, category_id, min_price, max_price, page_size)
+        if facets:
+            body["aggs"] = self.build_facet_aggs()
+
+        if cursor is None:
+            body["from"] = (page - 1) * page_size
+            result = await self.es.search(index=self.index_name, body=body,
+                                          request_timeout=settings.ES_SEARCH_TIMEOUT)
+            return self.build_search_result(result, page, page_size)
+
+        pit_id, search_after = self.decode_cursor(cursor)
+        if pit_id is None:
+            pit_id = (await self.es.open_point_in_time(
+                index=self.index_name, keep_alive=settings.ES_PIT_KEEP_ALIVE,
+                request_timeout=settings.ES_SEARCH_TIMEOUT))["id"]
+        body["pit"] = {"id": pit_id, "keep_alive": settings.ES_PIT_KEEP_ALIVE}
+        if search_after:
+            body["search_after"] = search_after
+
+        try:
+            result = await self.es.search(body=body, request_timeout=settings.ES_SEARCH_TIMEOUT)
+        except (NotFoundError, RequestError) as e:
+            self.check_cursor_error(search_after, e)
+            raise
+        search_result = self.build_search_result(result, page, page_size)
+        search_result["next_cursor"] = self.next_cursor(result, page_size)
+        if search_result["next_cursor"] is None:
+            await self.close_point_in_time(result["pit_id"])
+        return search_result
+
+    async def suggest_products(self, prefix: str, size: int = 10) -> list:
+        """搜索联想"""
+        result = await self.es.search(index=self.index_name, body=self.build_suggest_body(prefix, size),
+                                      request_timeout=settings.ES_SEARCH_TIMEOUT)
+        return self.build_suggest_result(result)
+
+    async def close_point_in_time(self, pit_id: str):
+        try:
+            await self.es.close_point_in_time(body={"id": pit_id})
+        except Exception as e:
+            logger.warning(f"Failed to close point-in-time: {str(e)}")
+
+    async def close(self):
+        await self.es.close()
+
+
 # 全局实例
-es_service = ElasticSearchService()
\ No newline at end of file
+es_service = ElasticSearchService()
+async_es_service = AsyncElasticSearchService()
+
+# 搜索调用的熔断器，ES变慢或故障时直接走数据库回退
+es_breaker = CircuitBreaker(
+    "elasticsearch",
+    failure_rate_threshold=settings.ES_BREAKER_FAILURE_RATE,
+    slow_call_rate_threshold=settings.ES_BREAKER_SLOW_CALL_RATE,
+    slow_call_duration=settings.ES_BREAKER_SLOW_CALL_DURATION,
+    window_size=settings.ES_BREAKER_WINDOW_SIZE,
+    minimum_calls=settings.ES_BREAKER_MINIMUM_CALLS,
+    open_duration=settings.ES_BREAKER_OPEN_DURATION,
+    half_open_max_calls=settings.ES_BREAKER_HALF_OPEN_CALLS,
+    # 续页游标无效或过期时search_products抛出ValueError，属于客户端问题，不计入ES故障；
+    # 索引不存在、映射错误等仍计为ES故障
+    ignore_exceptions=(ValueError,)
+)
\ No newline at end of file
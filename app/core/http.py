@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/20
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayClient:
+    """支付网关HTTP客户端
+
+    同步请求共用一个requests.Session连接池，异步请求共用一个httpx.AsyncClient，
+    连接保持长连接，客户端证书只在建立连接时加载。每个操作有独立的连接/读取超时，
+    网关变慢时请求按超时失败，不会无限期占住worker。
+    """
+
+    def __init__(self, name: str, base_url: str, cert: Optional[Tuple[str, str]] = None,
+                 timeouts: Dict[str, Tuple[float, float]] = None, pool_maxsize: int = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.cert = cert
+        self.timeouts = timeouts or {}
+        self.pool_maxsize = pool_maxsize or settings.GATEWAY_POOL_MAXSIZE
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        self._async_client = None
+        self._stats = defaultdict(lambda: {"requests": 0, "errors": 0, "timeouts": 0, "total_time": 0.0})
+
+    def timeout(self, operation: str) -> Tuple[float, float]:
+        """(连接超时, 读取超时)"""
+        return self.timeouts.get(operation, (settings.GATEWAY_CONNECT_TIMEOUT, settings.GATEWAY_READ_TIMEOUT))
+
+    @property
+    def session(self) -> requests.Session:
+        # fork出的子进程不能复用父进程的连接
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize,
+                                          max_retries=0, pool_block=False)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.cert = self.cert
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                cert=self.cert,
+                limits=httpx.Limits(max_connections=self.pool_maxsize,
+                                    max_keepalive_connections=self.pool_maxsize)
+            )
+        return self._async_client
+
+    def post(self, operation: str, path: str, data=None, headers: dict = None,
+             stream: bool = False) -> requests.Response:
+        """stream为True时不读取响应体，由调用方逐块读取后关闭(读取超时对每次读取生效)"""
+        connect_timeout, read_timeout = self.timeout(operation)
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.base_url + path, data=data, headers=headers,
+                                         timeout=(connect_timeout, read_timeout), stream=stream)
+            response.raise_for_status()
+        except requests.Timeout:
+            self._record(operation, start, error=True, timed_out=True)
+            logger.error(f"{self.name} {operation} timed out")
+            raise
+        except requests.RequestException:
+            self._record(operation, start, error=True)
+            raise
+        self._record(operation, start)
+        return response
+
+    async def post_async(self, operation: str, path: str, data=None, headers: dict = None) -> httpx.Response:
+        connect_timeout, read_timeout = self.timeout(operation)
+        start = time.monotonic()
+        try:
+            response = await self.async_client.post(
+                self.base_url + path, content=data, headers=headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+            )
+            response.raise_for_status()
+        except httpx.TimeoutException:
+            self._record(operation, start, error=True, timed_out=True)
+            logger.error(f"{self.name} {operation} timed out")
+            raise
+        except httpx.HTTPError:
+            self._record(operation, start, error=True)
+            raise
+        self._record(operation, start)
+        return response
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _record(self, operation: str, start: float, error: bool = False, timed_out: bool = False):
+        with self._lock:
+            stats = self._stats[operation]
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["timeouts"] += int(timed_out)
+            stats["total_time"] += time.monotonic() - start
+
+    def stats(self) -> dict:
+        """各操作的请求数/错误数/平均耗时，以及同步连接池的连接数"""
+        with self._lock:
+            operations = {
+                operation: {**stats, "avg_time": stats["total_time"] / stats["requests"] if stats["requests"] else 0}
+                for operation, stats in self._stats.items()
+            }
+
+        pools = []
+        if self._session is not None:
+            adapter = self._session.get_adapter(self.base_url)
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                pools.append({
+                    "host": pool.host,
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "available": pool.pool.qsize() if pool.pool else 0,  # 空闲连接和未建立的名额
+                    "max_size": self.pool_maxsize
+                })
+        return {"name": self.name, "operations": operations, "pools": pools}
+
+
+# 全局实例
+wechat_http = GatewayClient(
+    "wechat",
+    settings.WECHAT_API_BASE,
+    timeouts={
+        "unifiedorder": (settings.GATEWAY_CONNECT_TIMEOUT, settings.WECHAT_CREATE_ORDER_TIMEOUT),
+        "orderquery": (settings.GATEWAY_CONNECT_TIMEOUT, settings.WECHAT_QUERY_TIMEOUT),
+        "downloadbill": (settings.GATEWAY_CONNECT_TIMEOUT, settings.WECHAT_DOWNLOAD_BILL_TIMEOUT),
+    }
+)
+# 退款接口需要客户端证书
+wechat_cert_http = GatewayClient(
+    "wechat_cert",
+    settings.WECHAT_API_BASE,
+    cert=(settings.WECHAT_CERT_PATH, settings.WECHAT_KEY_PATH) if settings.WECHAT_CERT_PATH else None,
+    timeouts={
+        "refund": (settings.GATEWAY_CONNECT_TIMEOUT, settings.WECHAT_REFUND_TIMEOUT),
+    }
+)
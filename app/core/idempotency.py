@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/19
+
+import hashlib
+import json
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.core.security import get_current_user
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+
+class IdempotentReplay(Exception):
+    """重复请求，直接返回保存的响应"""
+
+    def __init__(self, status_code: int, body: str, media_type: str):
+        self.status_code = status_code
+        self.body = body
+        self.media_type = media_type
+
+
+class IdempotencyKey:
+    """一个幂等键的状态
+
+    首次请求用SET NX占位(in_flight，短TTL)，完成后保存状态码和响应体(IDEMPOTENCY_TTL)；
+    同一个键的重试直接回放保存的响应，处理中返回409，请求体不同返回422。
+    """
+
+    KEY = "idempotency:{scope}:{user_id}:{key}"
+
+    def __init__(self, scope: str, user_id, key: str, fingerprint: str):
+        self.redis_key = self.KEY.format(scope=scope, user_id=user_id, key=key)
+        self.fingerprint = fingerprint
+        self.finished = False
+
+    def begin(self):
+        placeholder = json.dumps({"state": IN_FLIGHT, "fingerprint": self.fingerprint})
+        if redis_client.set(self.redis_key, placeholder, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL):
+            return
+
+        value = redis_client.get(self.redis_key)
+        if value is None:
+            # 占位刚好过期，重新抢占
+            if redis_client.set(self.redis_key, placeholder, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL):
+                return
+            value = redis_client.get(self.redis_key) or placeholder
+
+        stored = json.loads(value)
+        self.finished = True
+        if stored["fingerprint"] != self.fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+        if stored["state"] == IN_FLIGHT:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+        raise IdempotentReplay(stored["status_code"], stored["body"], stored["media_type"])
+
+    def complete(self, status_code: int, body: bytes, media_type: Optional[str]):
+        self.finished = True
+        redis_client.set(self.redis_key, json.dumps({
+            "state": COMPLETED,
+            "fingerprint": self.fingerprint,
+            "status_code": status_code,
+            "body": body.decode("utf-8", errors="replace"),
+            "media_type": media_type
+        }), ex=settings.IDEMPOTENCY_TTL)
+
+    def release(self):
+        """处理失败(5xx或异常)时删除占位，客户端可以用同一个键重试"""
+        self.finished = True
+        redis_client.delete(self.redis_key)
+
+
+def idempotency(scope: str):
+    """幂等依赖工厂，带Idempotency-Key请求头时生效，响应由IdempotencyMiddleware保存"""
+
+    async def dependency(
+        request: Request,
+        idempotency_key: Optional[str] = Header(None),
+        current_user: dict = Depends(get_current_user)
+    ) -> Optional[IdempotencyKey]:
+        if not idempotency_key:
+            return None
+        if len(idempotency_key) > 64:
+            raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+
+        body = await request.body()
+        fingerprint = hashlib.sha256(request.method.encode() + request.url.path.encode() + body).hexdigest()
+        key = IdempotencyKey(scope, current_user["id"], idempotency_key, fingerprint)
+        await run_in_threadpool(key.begin)
+        request.state.idempotency = key
+        return key
+
+    return dependency
+
+
+async def idempotent_replay_handler(request: Request, exc: IdempotentReplay):
+    return Response(content=exc.body, status_code=exc.status_code, media_type=exc.media_type,
+                    headers={"Idempotent-Replayed": "true"})
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/8
+
+from redis import Redis
+from app.core.config import settings
+
+# 全局实例
+redis_client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
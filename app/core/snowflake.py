@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/14
+
+import logging
+import os
+import socket
+import threading
+import time
+from app.core.config import settings
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 41位毫秒时间戳 | 10位worker ID | 12位序列号
+EPOCH_MS = 1704067200000  # 2024-01-01 00:00:00 UTC
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MAX_CLOCK_BACKWARD_MS = 5
+
+# 续期worker ID租约：仍归本进程所有时延长过期时间；已过期时重新占用；
+# 已被其他进程占用时返回0，调用方需要重新租用
+# KEYS: 租约
+# ARGV: 持有者, 过期时间(秒)
+RENEW_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class SnowflakeGenerator:
+    """Snowflake风格的分布式ID生成器
+
+    ID按时间单调递增，生成时不访问数据库或Redis。每个进程的worker ID在首次使用时
+    从Redis租用(定期续期)，fork出的子进程会重新租用，多个uvicorn worker之间不会冲突。
+    续期时校验持有者，租约已被其他进程占用时重新租用；租约已过期又无法续期、或无法租用时
+    拒绝生成，之后的调用会重新租用。只有配置了SNOWFLAKE_WORKER_ID时不使用租约。
+    单进程每毫秒最多生成4096个ID。
+    """
+
+    WORKER_SEQ_KEY = "snowflake:worker_seq"
+    WORKER_LEASE_KEY = "snowflake:worker:{worker_id}"
+
+    def __init__(self):
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._worker_id = None
+        self._owner = None
+        self._lease_renew_at = 0
+        self._lease_expires_at = 0
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._worker_id is None:
+                self._worker_id = self._assign_worker_id()
+            elif self._lease_renew_at and time.monotonic() >= self._lease_renew_at:
+                self._renew_lease()
+
+            now = self._now_ms()
+            if now < self._last_ms:
+                # 时钟回拨：小幅回拨等待追上，否则拒绝生成以免重复
+                if self._last_ms - now > MAX_CLOCK_BACKWARD_MS:
+                    raise RuntimeError(f"Clock moved backwards by {self._last_ms - now}ms")
+                while now < self._last_ms:
+                    time.sleep((self._last_ms - now) / 1000)
+                    now = self._now_ms()
+
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 本毫秒序列号用尽，等到下一毫秒
+                    while now <= self._last_ms:
+                        now = self._now_ms()
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return ((now - EPOCH_MS) << (WORKER_ID_BITS + SEQUENCE_BITS)) | \
+                (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+    @staticmethod
+    def _now_ms() -> int:
+        return time.time_ns() // 1_000_000
+
+    def _assign_worker_id(self) -> int:
+        if settings.SNOWFLAKE_WORKER_ID >= 0:
+            return settings.SNOWFLAKE_WORKER_ID & MAX_WORKER_ID
+
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            start = redis_client.incr(self.WORKER_SEQ_KEY)
+            for i in range(MAX_WORKER_ID + 1):
+                worker_id = (start + i) & MAX_WORKER_ID
+                if redis_client.set(self.WORKER_LEASE_KEY.format(worker_id=worker_id), owner,
+                                    nx=True, ex=settings.SNOWFLAKE_LEASE_TTL):
+                    self._owner = owner
+                    self._leased()
+                    logger.info(f"Leased snowflake worker id {worker_id} for {owner}")
+                    return worker_id
+        except Exception as e:
+            # 没有租约的worker ID可能与其他进程重复，拒绝生成，下次调用时重新租用
+            raise RuntimeError(f"Snowflake worker id lease failed: {str(e)}")
+        raise RuntimeError("No snowflake worker id available")
+
+    def _leased(self):
+        now = time.monotonic()
+        self._lease_renew_at = now + settings.SNOWFLAKE_LEASE_TTL / 4
+        self._lease_expires_at = now + settings.SNOWFLAKE_LEASE_TTL
+
+    def _renew_lease(self):
+        try:
+            renewed = self._renew(keys=[self.WORKER_LEASE_KEY.format(worker_id=self._worker_id)],
+                                  args=[self._owner, settings.SNOWFLAKE_LEASE_TTL])
+        except Exception as e:
+            if time.monotonic() >= self._lease_expires_at:
+                # 租约可能已被其他进程占用，继续生成可能产生重复ID
+                raise RuntimeError(f"Snowflake worker id lease expired and cannot be renewed: {str(e)}")
+            logger.warning(f"Snowflake worker id lease renewal failed: {str(e)}")
+            return
+
+        if renewed:
+            self._leased()
+            return
+
+        logger.warning(f"Snowflake worker id {self._worker_id} was taken over, leasing a new one")
+        self._lease_renew_at = 0
+        self._worker_id = None
+        self._worker_id = self._assign_worker_id()
+
+
+# 全局实例
+id_generator = SnowflakeGenerator()
+
+
+def generate_order_no() -> str:
+    """生成订单号"""
+    return str(id_generator.next_id())
+
+
+def generate_payment_no() -> str:
+    """生成支付流水号"""
+    return f"PY{id_generator.next_id()}"
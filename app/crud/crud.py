@@ -6,6 +6,7 @@
 from sqlalchemy.orm import Session
 from app.models import models
 from app.schemas import schemas
+from app.services.inventory import InventoryService
 
 
 def get_user(db: Session, user_id: int):
@@ -50,11 +51,15 @@ def create_order(db: Session, order: schemas.OrderCreate, user_id: int):
         status="completed"
     )
 
-    # 更新库存
-    product.stock -= order.quantity
+    # 条件扣减库存，与订单在同一事务中，库存不足时整体回滚
+    try:
+        InventoryService(db).deduct([(order.product_id, None, order.quantity)])
+        db.add(db_order)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-    db.add(db_order)
-    db.commit()
     db.refresh(db_order)
     return db_order
 
@@ -0,0 +1,28 @@
+CREATE TABLE `orders_archive` (
+  `id` bigint NOT NULL,
+  `order_no` varchar(32) NOT NULL,
+  `user_id` bigint NOT NULL,
+  `total_amount` decimal(10,2) NOT NULL,
+  `payment_amount` decimal(10,2) NOT NULL,
+  `discount_amount` decimal(10,2) DEFAULT '0.00',
+  `shipping_fee` decimal(10,2) DEFAULT '0.00',
+  `payment_method` tinyint DEFAULT NULL COMMENT '1-微信, 2-支付宝, 3-京东',
+  `payment_time` datetime DEFAULT NULL,
+  `payment_transaction_id` varchar(100) DEFAULT NULL,
+  `status` tinyint DEFAULT NULL COMMENT '9-已完成, 10-已取消',
+  `shipping_address_id` bigint DEFAULT NULL,
+  `shipping_address` text NOT NULL,
+  `shipping_company` varchar(50) DEFAULT NULL,
+  `shipping_number` varchar(50) DEFAULT NULL,
+  `shipping_time` datetime DEFAULT NULL,
+  `receive_time` datetime DEFAULT NULL,
+  `note` text,
+  `invoice_needed` tinyint(1) DEFAULT '0',
+  `invoice_title` varchar(100) DEFAULT NULL,
+  `invoice_content` varchar(100) DEFAULT NULL,
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `idx_order_no` (`order_no`),
+  KEY `idx_user_id_id` (`user_id`, `id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 ROW_FORMAT=COMPRESSED;
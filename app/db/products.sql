@@ -9,5 +9,9 @@ CREATE TABLE `products` (
   `status` tinyint DEFAULT '1' COMMENT '1-上架, 0-下架',
   `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
   `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  KEY `idx_updated_at` (`updated_at`, `id`),
+  -- 需要在my.cnf中设置ngram_token_size=1(只读参数，重启后生效)后再建立或重建该索引，
+  -- 单字词(如"鞋")才能走全文索引；修改该参数时需同步SEARCH_NGRAM_TOKEN_SIZE
+  FULLTEXT KEY `ft_name_description` (`name`, `description`) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
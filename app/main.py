@@ -9,9 +9,16 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.v1 import admin, client
+from app.core.audit import audit_buffer
 from app.core.config import settings
+from app.core.idempotency import IdempotentReplay, idempotent_replay_handler
+from app.core.elasticsearch import async_es_service
+from app.core.http import wechat_http, wechat_cert_http
 from app.core.logging import setup_logging
 from app.db.session import SessionLocal
+from app.services.suggest import suggest_service
+from middlewares.idempotency import IdempotencyMiddleware
+from middlewares.operation_log import OperationLogger
 
 setup_logging()
 
@@ -24,13 +31,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
+app.middleware("http")(OperationLogger())
+app.middleware("http")(IdempotencyMiddleware())
 
 # 路由
 app.include_router(client.router, prefix="/api/v1/client")
 app.include_router(admin.router, prefix="/api/v1/admin")
 
 # 异常处理
+app.add_exception_handler(IdempotentReplay, idempotent_replay_handler)
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
@@ -38,6 +50,27 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors(), "body": exc.body},
     )
 
+# 启动时在后台构建搜索联想索引，不阻塞第一个请求
+@app.on_event("startup")
+def warm_suggest_index():
+    suggest_service.refresh_in_background()
+
+# 关闭异步ES客户端连接池
+@app.on_event("shutdown")
+async def close_elasticsearch():
+    await async_es_service.close()
+
+# 关闭支付网关异步连接池
+@app.on_event("shutdown")
+async def close_gateway_clients():
+    await wechat_http.aclose()
+    await wechat_cert_http.aclose()
+
+# 写入缓冲中剩余的审计日志
+@app.on_event("shutdown")
+def flush_audit_logs():
+    audit_buffer.close()
+
 # 数据库中间件
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
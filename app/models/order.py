@@ -3,7 +3,7 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from sqlalchemy import Column, String, Integer, Numeric, Text, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Numeric, Text, Boolean, ForeignKey, Enum, Index
 from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.orm import relationship
 from app.models.base import Base
@@ -32,6 +32,10 @@ class PaymentMethod(IntEnum):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # 用户订单列表按(user_id, id DESC)游标分页
+        Index("idx_user_id_id", "user_id", "id"),
+    )
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     order_no = Column(String(32), unique=True, nullable=False)
@@ -44,6 +48,8 @@ class Order(Base):
     payment_time = Column(DateTime, nullable=True)
     payment_transaction_id = Column(String(100), nullable=True)
     status = Column(Enum(OrderStatus), default=OrderStatus.SUBMITTED)
+    # 乐观锁版本号，每次状态转换加1
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     shipping_address_id = Column(BIGINT, ForeignKey("user_addresses.id"), nullable=True)
     shipping_address = Column(Text, nullable=False)
     shipping_company = Column(String(50), nullable=True)
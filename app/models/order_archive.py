@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/18
+
+from sqlalchemy import Column, String, Integer, Numeric, Text, Boolean, DateTime, Enum, Index
+from sqlalchemy.dialects.mysql import BIGINT
+from sqlalchemy.orm import relationship
+from app.models.base import Base
+from app.models.order import OrderStatus, PaymentMethod
+from app.models.payment import PaymentStatus, PaymentMethod as PaymentChannel
+
+# 归档表与线上表字段一致(保留原ID)，不建外键，只读
+
+
+class OrderArchive(Base):
+    __tablename__ = "orders_archive"
+    __table_args__ = (
+        Index("idx_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(BIGINT, primary_key=True, autoincrement=False)
+    order_no = Column(String(32), unique=True, nullable=False)
+    user_id = Column(BIGINT, nullable=False)
+    total_amount = Column(Numeric(10, 2), nullable=False)
+    payment_amount = Column(Numeric(10, 2), nullable=False)
+    discount_amount = Column(Numeric(10, 2), default=0)
+    shipping_fee = Column(Numeric(10, 2), default=0)
+    payment_method = Column(Enum(PaymentMethod), nullable=True)
+    payment_time = Column(DateTime, nullable=True)
+    payment_transaction_id = Column(String(100), nullable=True)
+    status = Column(Enum(OrderStatus))
+    shipping_address_id = Column(BIGINT, nullable=True)
+    shipping_address = Column(Text, nullable=False)
+    shipping_company = Column(String(50), nullable=True)
+    shipping_number = Column(String(50), nullable=True)
+    shipping_time = Column(DateTime, nullable=True)
+    receive_time = Column(DateTime, nullable=True)
+    note = Column(Text, nullable=True)
+    invoice_needed = Column(Boolean, default=False)
+    invoice_title = Column(String(100), nullable=True)
+    invoice_content = Column(String(100), nullable=True)
+
+    items = relationship("OrderItemArchive", primaryjoin="OrderArchive.id == foreign(OrderItemArchive.order_id)",
+                         viewonly=True)
+    payment = relationship("PaymentArchive", primaryjoin="OrderArchive.id == foreign(PaymentArchive.order_id)",
+                           uselist=False, viewonly=True)
+    logs = relationship("OrderLogArchive", primaryjoin="OrderArchive.id == foreign(OrderLogArchive.order_id)",
+                        order_by="OrderLogArchive.id", viewonly=True)
+
+    def __repr__(self):
+        return f"<OrderArchive(id={self.id}, order_no={self.order_no}, status={self.status.name})>"
+
+
+class OrderItemArchive(Base):
+    __tablename__ = "order_items_archive"
+
+    id = Column(BIGINT, primary_key=True, autoincrement=False)
+    order_id = Column(BIGINT, nullable=False, index=True)
+    product_id = Column(BIGINT, nullable=False)
+    sku_id = Column(BIGINT, nullable=True)
+    product_name = Column(String(100), nullable=False)
+    product_image = Column(String(255), nullable=True)
+    sku_attributes = Column(String(255), nullable=True)
+    price = Column(Numeric(10, 2), nullable=False)
+    original_price = Column(Numeric(10, 2), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    total_price = Column(Numeric(10, 2), nullable=False)
+    refund_status = Column(Integer, default=0)
+
+
+class PaymentArchive(Base):
+    __tablename__ = "payments_archive"
+
+    id = Column(BIGINT, primary_key=True, autoincrement=False)
+    order_id = Column(BIGINT, nullable=False, index=True)
+    payment_no = Column(String(32), unique=True, nullable=False)
+    transaction_id = Column(String(64), nullable=True)
+    method = Column(Enum(PaymentChannel), nullable=False)
+    amount = Column(Numeric(10, 2), nullable=False)
+    status = Column(Enum(PaymentStatus))
+    paid_time = Column(DateTime, nullable=True)
+    payment_info = Column(Text, nullable=True)
+    refund_amount = Column(Numeric(10, 2), default=0)
+    refund_time = Column(DateTime, nullable=True)
+    callback_time = Column(DateTime, nullable=True)
+    callback_content = Column(Text, nullable=True)
+
+
+class OrderLogArchive(Base):
+    __tablename__ = "order_logs_archive"
+
+    id = Column(BIGINT, primary_key=True, autoincrement=False)
+    order_id = Column(BIGINT, nullable=False, index=True)
+    action = Column(String(50), nullable=False)
+    operator_id = Column(BIGINT, nullable=True)
+    operator_type = Column(Integer, nullable=False)
+    operator_name = Column(String(50), nullable=True)
+    note = Column(Text, nullable=True)
+    ip_address = Column(String(50), nullable=True)
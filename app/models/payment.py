@@ -3,7 +3,7 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from sqlalchemy import Column, String, Integer, Numeric, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Numeric, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.orm import relationship
 from app.models.base import Base
@@ -26,6 +26,12 @@ class PaymentMethod(IntEnum):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # 对账任务按状态+主键游标扫描待支付记录
+        Index("idx_status_id", "status", "id"),
+        # 对账单核对按支付时间分页
+        Index("idx_paid_time", "paid_time", "id"),
+    )
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     order_id = Column(BIGINT, ForeignKey("orders.id"), nullable=False)
@@ -34,6 +40,8 @@ class Payment(Base):
     method = Column(Enum(PaymentMethod), nullable=False)
     amount = Column(Numeric(10, 2), nullable=False)
     status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
+    # 乐观锁版本号，每次状态转换加1
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     paid_time = Column(DateTime, nullable=True)
     payment_info = Column(Text, nullable=True)  # 支付信息(JSON)
     refund_amount = Column(Numeric(10, 2), default=0)
@@ -3,7 +3,7 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
-from sqlalchemy import Column, String, Integer, Numeric, Text, Boolean, ForeignKey
+from sqlalchemy import Column, String, Integer, Numeric, Text, Boolean, ForeignKey, Index
 from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.orm import relationship
 from app.models.base import Base
@@ -11,6 +11,13 @@ from app.models.base import Base
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("idx_updated_at", "updated_at", "id"),
+        # 数据库回退搜索使用，ngram解析器支持中文；
+        # 按ngram_token_size=1建立，单字词也能命中，见products.sql和SEARCH_NGRAM_TOKEN_SIZE
+        Index("ft_name_description", "name", "description",
+              mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
+    )
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
@@ -54,6 +61,9 @@ class ProductImage(Base):
 
 class ProductSku(Base):
     __tablename__ = "product_skus"
+    __table_args__ = (
+        Index("idx_updated_at", "updated_at", "id"),
+    )
 
     id = Column(BIGINT, primary_key=True, autoincrement=True)
     product_id = Column(BIGINT, ForeignKey("products.id"), nullable=False)
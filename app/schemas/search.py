@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/3
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class SearchProduct(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    price: float
+    image_url: Optional[str] = None
+    stock: Optional[int] = None
+    highlight_name: Optional[str] = None
+    highlight_description: Optional[str] = None
+
+
+class FacetBucket(BaseModel):
+    value: str
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: float
+    count: int
+
+
+class AttributeFacet(BaseModel):
+    name: str
+    values: List[FacetBucket]
+
+
+class SearchFacets(BaseModel):
+    categories: List[FacetBucket]
+    price: List[PriceBucket]
+    attributes: List[AttributeFacet]
+
+
+class SearchResult(BaseModel):
+    total: int
+    products: List[SearchProduct]
+    page: int
+    page_size: int
+    next_cursor: Optional[str] = None  # 游标翻页时下一页的游标，没有更多结果时为空
+    facets: Optional[SearchFacets] = None  # 请求facets=true时返回
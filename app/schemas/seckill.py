@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/12
+
+from pydantic import BaseModel
+from typing import Optional
+
+
+class SeckillItemCreate(BaseModel):
+    product_id: int
+    sku_id: Optional[int] = None
+    stock: int
+    price: float
+    limit_per_user: int = 1
+
+
+class SeckillReserve(BaseModel):
+    sku_id: Optional[int] = None
+    quantity: int = 1
+    address_id: int
+
+
+class SeckillReservation(BaseModel):
+    token: str
+    status: str
+    order_id: Optional[int] = None
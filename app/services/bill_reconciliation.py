@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/23
+
+import csv
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Iterable
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.models.payment import Payment, PaymentStatus, PaymentMethod
+from app.services.wechat_pay import WeChatPayService
+
+REPORT_FIELDS = ("type", "payment_no", "transaction_id", "bill_state", "bill_amount",
+                 "local_status", "local_amount", "note")
+PAID_STATUSES = (PaymentStatus.SUCCESS, PaymentStatus.REFUNDED)
+
+
+class BillReconciliationService:
+    """微信对账单核对
+
+    账单逐行读取，每BILL_RECONCILE_CHUNK_SIZE行用一次IN查询按payment_no取本地支付记录比对；
+    账单中出现过的payment_no暂存在Redis集合，最后按支付时间分页检查本地已支付但账单中
+    没有的记录。差异逐行写入CSV报告，内存占用与账单大小无关。
+    """
+
+    SEEN_KEY = "bill_reconcile:{bill_date}:seen"
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def reconcile(self, bill_date: str = None, report_path: str = None) -> dict:
+        """核对一天的账单(YYYYMMDD，默认昨天)，返回差异统计和报告路径"""
+        bill_date = bill_date or (datetime.now() - timedelta(days=1)).strftime("%Y%m%d")
+        if report_path is None:
+            os.makedirs(settings.BILL_REPORT_DIR, exist_ok=True)
+            report_path = os.path.join(settings.BILL_REPORT_DIR, f"wechat_{bill_date}.csv")
+
+        seen_key = self.SEEN_KEY.format(bill_date=bill_date)
+        redis_client.delete(seen_key)
+        stats = {"bill_rows": 0, "matched": 0, "discrepancies": 0}
+        with open(report_path, "w", newline="", encoding="utf-8") as report_file:
+            report = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            report.writeheader()
+
+            bill = WeChatPayService().download_bill(bill_date)
+            rows = iter(bill)
+            while True:
+                chunk = list(islice(rows, settings.BILL_RECONCILE_CHUNK_SIZE))
+                if not chunk:
+                    break
+                stats["bill_rows"] += len(chunk)
+                discrepancies = self.check_chunk(chunk)
+                stats["matched"] += len(chunk) - len(discrepancies)
+                stats["discrepancies"] += len(discrepancies)
+                report.writerows(discrepancies)
+
+                payment_nos = {row.get("out_trade_no") for row in chunk if row.get("out_trade_no")}
+                if payment_nos:
+                    pipeline = redis_client.pipeline()
+                    pipeline.sadd(seen_key, *payment_nos)
+                    pipeline.expire(seen_key, 86400)
+                    pipeline.execute()
+
+            for discrepancies in self.find_missing_in_bill(bill_date, seen_key):
+                stats["discrepancies"] += len(discrepancies)
+                report.writerows(discrepancies)
+
+        redis_client.delete(seen_key)
+        stats["summary"] = bill.summary
+        stats["report"] = report_path
+        logger.info(f"WeChat bill {bill_date} reconciled: {stats}")
+        return stats
+
+    def check_chunk(self, chunk: list) -> list:
+        """比对一块账单行，返回差异"""
+        payment_nos = {row.get("out_trade_no") for row in chunk if row.get("out_trade_no")}
+        payments = {row.payment_no: row for row in self.db.query(
+            Payment.payment_no, Payment.transaction_id, Payment.amount, Payment.status, Payment.refund_amount
+        ).filter(Payment.payment_no.in_(payment_nos))}
+
+        discrepancies = []
+        for row in chunk:
+            payment = payments.get(row.get("out_trade_no"))
+            note = self.compare(row, payment)
+            if note:
+                discrepancies.append({
+                    "type": note[0],
+                    "payment_no": row.get("out_trade_no"),
+                    "transaction_id": row.get("transaction_id"),
+                    "bill_state": row.get("trade_state"),
+                    "bill_amount": row.get("total_fee"),
+                    "local_status": payment.status.name if payment else None,
+                    "local_amount": payment.amount if payment else None,
+                    "note": note[1]
+                })
+        return discrepancies
+
+    @staticmethod
+    def compare(row: dict, payment):
+        """返回(差异类型, 说明)，一致时返回None"""
+        if payment is None:
+            return "missing_local", "账单中有，本地无支付记录"
+        if payment.transaction_id and row.get("transaction_id") \
+                and payment.transaction_id != row.get("transaction_id"):
+            return "transaction_mismatch", f"本地交易号{payment.transaction_id}"
+
+        state = row.get("trade_state")
+        if state == "REFUND":
+            if not payment.refund_amount:
+                return "refund_missing", f"账单退款{row.get('refund_fee')}，本地未退款"
+            return None
+        if state == "SUCCESS":
+            if payment.status not in PAID_STATUSES:
+                return "status_mismatch", "账单已支付，本地未支付"
+            try:
+                amount = Decimal(row.get("total_fee") or "0")
+            except InvalidOperation:
+                return "amount_mismatch", "账单金额无法解析"
+            if amount != payment.amount:
+                return "amount_mismatch", f"账单金额{amount}，本地金额{payment.amount}"
+        return None
+
+    def find_missing_in_bill(self, bill_date: str, seen_key: str) -> Iterable[list]:
+        """本地当天已支付、账单中没有的记录"""
+        day = datetime.strptime(bill_date, "%Y%m%d")
+        chunk_size = settings.BILL_RECONCILE_CHUNK_SIZE
+        last_time, last_id = day, 0
+        while True:
+            # 按(paid_time, id)游标分页，走idx_paid_time索引
+            rows = self.db.query(
+                Payment.id, Payment.payment_no, Payment.transaction_id, Payment.amount,
+                Payment.status, Payment.paid_time
+            ).filter(
+                or_(Payment.paid_time > last_time,
+                    and_(Payment.paid_time == last_time, Payment.id > last_id)),
+                Payment.paid_time < day + timedelta(days=1),
+                Payment.method == PaymentMethod.WECHAT,
+                Payment.status.in_(PAID_STATUSES)
+            ).order_by(Payment.paid_time, Payment.id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_time, last_id = rows[-1].paid_time, rows[-1].id
+
+            pipeline = redis_client.pipeline()
+            for row in rows:
+                pipeline.sismember(seen_key, row.payment_no)
+            yield [{
+                "type": "missing_remote",
+                "payment_no": row.payment_no,
+                "transaction_id": row.transaction_id,
+                "bill_state": None,
+                "bill_amount": None,
+                "local_status": row.status.name,
+                "local_amount": row.amount,
+                "note": "本地已支付，账单中没有"
+            } for row, seen in zip(rows, pipeline.execute()) if not seen]
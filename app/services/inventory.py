@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/13
+
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session
+from app.models.product import Product, ProductSku
+
+
+class InsufficientStockError(ValueError):
+    """库存不足"""
+
+
+class InventoryService:
+    """库存扣减与退回
+
+    使用条件UPDATE(stock >= :q)代替先查后改，不加行锁也不会超卖；
+    多行按(表, id)固定顺序更新，避免并发事务互相死锁。
+    提交和回滚由调用方负责，库存变更与订单写入在同一个事务中。
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def deduct(self, items: Iterable[Tuple[int, Optional[int], int]]):
+        """扣减库存，items为(product_id, sku_id, quantity)
+
+        有SKU的行扣减SKU库存，否则扣减商品库存。任一行不足时抛出InsufficientStockError，
+        此前已执行的UPDATE由调用方回滚。
+        """
+        for product_id, sku_id, quantity in self.merge(items):
+            if not self.deduct_row(product_id, sku_id, quantity):
+                raise InsufficientStockError(f"商品库存不足: {product_id}")
+
+    def deduct_row(self, product_id: int, sku_id: Optional[int], quantity: int) -> bool:
+        """条件扣减一行库存，库存不足时不修改并返回False"""
+        model, row_id = (ProductSku, sku_id) if sku_id else (Product, product_id)
+        result = self.db.execute(
+            update(model)
+            .where(model.id == row_id, model.stock >= quantity)
+            .values(stock=model.stock - quantity, sold_count=model.sold_count + quantity)
+        )
+        return result.rowcount == 1
+
+    def available(self, product_id: int, sku_id: Optional[int]) -> int:
+        """一行的当前库存"""
+        model, row_id = (ProductSku, sku_id) if sku_id else (Product, product_id)
+        return self.db.query(model.stock).filter(model.id == row_id).scalar() or 0
+
+    def restore(self, items: Iterable[Tuple[int, Optional[int], int]]):
+        """退回库存(取消订单等)"""
+        for product_id, sku_id, quantity in self.merge(items):
+            model, row_id = (ProductSku, sku_id) if sku_id else (Product, product_id)
+            self.db.execute(
+                update(model)
+                .where(model.id == row_id)
+                .values(
+                    stock=model.stock + quantity,
+                    sold_count=func.greatest(model.sold_count - quantity, 0)
+                )
+            )
+
+    @staticmethod
+    def merge(items) -> list:
+        """合并同一行的数量，并按商品行在前、SKU行在后、各自按id排序"""
+        quantities = {}
+        for product_id, sku_id, quantity in items:
+            key = (1, sku_id, product_id) if sku_id else (0, product_id, None)
+            quantities[key] = quantities.get(key, 0) + quantity
+
+        merged = []
+        for key in sorted(quantities, key=lambda key: key[:2]):
+            is_sku, row_id, product_id = key
+            if is_sku:
+                merged.append((product_id, row_id, quantities[key]))
+            else:
+                merged.append((row_id, None, quantities[key]))
+        return merged
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/18
+
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.order_archive import OrderArchive, OrderItemArchive, PaymentArchive, OrderLogArchive
+from app.models.order_log import OrderLog
+from app.models.payment import Payment
+
+# 只归档终态订单
+ARCHIVABLE_STATUSES = (OrderStatus.COMPLETED, OrderStatus.CANCELLED)
+
+# (线上表, 归档表)，子表在前，删除时先删子表
+CHILD_TABLES = (
+    (OrderItem, OrderItemArchive),
+    (Payment, PaymentArchive),
+    (OrderLog, OrderLogArchive),
+)
+
+
+class OrderArchiveService:
+    """订单冷热分离
+
+    创建超过ORDER_ARCHIVE_AFTER_DAYS天的终态订单连同明细、支付和日志，按主键分块
+    INSERT ... SELECT到归档表后从线上表删除，每块一个事务，块之间休眠限速，
+    线上表只保留近期和未完结的订单。
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def archive(self, chunk_size: int = None, max_chunks: int = None) -> dict:
+        chunk_size = chunk_size or settings.ORDER_ARCHIVE_CHUNK_SIZE
+        max_chunks = max_chunks or settings.ORDER_ARCHIVE_MAX_CHUNKS
+        cutoff = datetime.now() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+
+        last_id = 0
+        archived = 0
+        for _ in range(max_chunks):
+            # 主键与创建时间同序，按主键扫描到截止时间为止
+            rows = self.db.query(Order.id, Order.status, Order.created_at).filter(
+                Order.id > last_id
+            ).order_by(Order.id).limit(chunk_size).all()
+            if not rows:
+                break
+            reached_cutoff = rows[-1].created_at >= cutoff
+            candidates = [row.id for row in rows
+                          if row.status in ARCHIVABLE_STATUSES and row.created_at < cutoff]
+            last_id = rows[-1].id
+
+            if candidates:
+                archived += self.archive_chunk(candidates)
+                time.sleep(settings.ORDER_ARCHIVE_SLEEP)
+            if reached_cutoff:
+                break
+
+        logger.info(f"Archived {archived} orders created before {cutoff}")
+        return {"archived": archived, "last_id": last_id}
+
+    def archive_chunk(self, order_ids: list) -> int:
+        """在一个事务中移动一批订单，返回实际移动的数量"""
+        try:
+            # 加锁并重新校验状态，期间状态变化的订单不移动
+            order_ids = [row.id for row in self.db.query(Order.id).filter(
+                Order.id.in_(order_ids), Order.status.in_(ARCHIVABLE_STATUSES)
+            ).with_for_update()]
+            if not order_ids:
+                self.db.rollback()
+                return 0
+
+            for model, archive_model in CHILD_TABLES:
+                self._copy(model, archive_model, model.order_id.in_(order_ids))
+            self._copy(Order, OrderArchive, Order.id.in_(order_ids))
+
+            for model, _ in CHILD_TABLES:
+                self.db.execute(delete(model.__table__).where(model.order_id.in_(order_ids)))
+            self.db.execute(delete(Order.__table__).where(Order.id.in_(order_ids)))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return len(order_ids)
+
+    def _copy(self, model, archive_model, condition):
+        columns = [column.name for column in archive_model.__table__.columns]
+        self.db.execute(
+            insert(archive_model).from_select(
+                columns, select([model.__table__.c[name] for name in columns]).where(condition)
+            )
+        )
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/15
+
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session, selectinload
+from app.models.order import Order
+from app.models.order_archive import OrderArchive
+from app.models.order_log import OrderLog  # noqa: F401 注册Order.logs
+from app.models.payment import Payment  # noqa: F401 注册Order.payment
+
+
+class OrderHistoryService:
+    """用户订单列表
+
+    按(user_id, id DESC)游标分页，走idx_user_id_id索引，翻到多深都只读取一页的行；
+    订单明细、支付和日志用selectinload各一次IN查询加载，每页固定条数的SQL。
+    已归档的订单在归档表中，线上表和归档表按同一游标各取一页后合并。
+    """
+
+    MAX_PAGE_SIZE = 100
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def list_orders(self, user_id: int, before_id: Optional[int] = None,
+                    page_size: int = 20) -> Tuple[list, Optional[int]]:
+        """返回一页订单和下一页游标(本页最后一个订单ID，没有下一页时为None)"""
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+
+        # 多取一条判断是否还有下一页
+        orders = self._page(Order, user_id, before_id, page_size + 1)
+        orders += self._page(OrderArchive, user_id, before_id, page_size + 1)
+        orders.sort(key=lambda order: order.id, reverse=True)
+
+        if len(orders) > page_size:
+            orders = orders[:page_size]
+            return orders, orders[-1].id
+        return orders, None
+
+    def list_orders_offset(self, user_id: int, skip: int = 0, limit: int = 100) -> list:
+        """旧版OFFSET分页，按ID倒序跨线上表和归档表
+
+        两张表各取前skip+limit个订单ID合并后截取本页，只为本页的订单加载明细。
+        """
+        skip = max(0, skip)
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+
+        ids = []
+        for model in (Order, OrderArchive):
+            ids += [row.id for row in self.db.query(model.id).filter(
+                model.user_id == user_id).order_by(model.id.desc()).limit(skip + limit)]
+        ids = sorted(ids, reverse=True)[skip:skip + limit]
+        if not ids:
+            return []
+
+        orders = []
+        for model in (Order, OrderArchive):
+            orders += self._query(model).filter(model.id.in_(ids)).all()
+        orders.sort(key=lambda order: order.id, reverse=True)
+        return orders
+
+    def get_order(self, order_id: int, user_id: Optional[int] = None):
+        """按ID查询订单，线上表没有时查归档表"""
+        for model in (Order, OrderArchive):
+            query = self._query(model).filter(model.id == order_id)
+            if user_id is not None:
+                query = query.filter(model.user_id == user_id)
+            order = query.first()
+            if order:
+                return order
+        return None
+
+    def _page(self, model, user_id: int, before_id: Optional[int], limit: int) -> list:
+        query = self._query(model).filter(model.user_id == user_id)
+        if before_id is not None:
+            query = query.filter(model.id < before_id)
+        return query.order_by(model.id.desc()).limit(limit).all()
+
+    def _query(self, model):
+        return self.db.query(model).options(
+            selectinload(model.items),
+            selectinload(model.payment),
+            selectinload(model.logs)
+        )
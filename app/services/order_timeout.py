@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/15
+
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import update, insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.order_log import OrderLog
+from app.services.inventory import InventoryService
+
+UNPAID_STATUSES = (OrderStatus.SUBMITTED, OrderStatus.PENDING_PAYMENT)
+
+# 取出一批已到期的订单，并把它们的分数推后一个租约时间：
+# 处理进程中途退出时，这些订单在租约到期后会被重新取出
+# KEYS: 到期队列
+# ARGV: 当前时间, 批大小, 租约到期时间
+CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[1], ARGV[3], member)
+end
+return due
+"""
+
+
+class OrderTimeoutService:
+    """未支付订单超时取消
+
+    订单的支付截止时间存放在Redis有序集合中(member为订单ID，score为截止时间戳)，
+    定时任务每次只取出已到期的一批，不扫描orders表。取消使用带状态条件的UPDATE，
+    与支付成功并发时只有一方生效。
+    """
+
+    DEADLINE_KEY = "order:payment_deadlines"
+
+    def __init__(self, db: Session = None):
+        self.db = db
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+
+    @staticmethod
+    def deadline_for(created_at: datetime = None) -> datetime:
+        return (created_at or datetime.now()) + timedelta(minutes=settings.ORDER_PAYMENT_TIMEOUT_MINUTES)
+
+    def schedule(self, orders: Iterable[Tuple[int, Optional[datetime]]], pipeline=None):
+        """登记订单的支付截止时间，orders为(order_id, created_at)，传入pipeline时由调用方执行"""
+        mapping = {str(order_id): self.deadline_for(created_at).timestamp() for order_id, created_at in orders}
+        if not mapping:
+            return
+        if pipeline is not None:
+            pipeline.zadd(self.DEADLINE_KEY, mapping)
+        else:
+            redis_client.zadd(self.DEADLINE_KEY, mapping)
+
+    def unschedule(self, *order_ids: int):
+        """订单已支付或已取消，移出到期队列"""
+        if order_ids:
+            redis_client.zrem(self.DEADLINE_KEY, *order_ids)
+
+    def cancel_expired(self, batch_size: int = None) -> dict:
+        """取消一批已到期的未支付订单，退回库存并写订单日志，一次提交"""
+        now = time.time()
+        claimed = self._claim(
+            keys=[self.DEADLINE_KEY],
+            args=[now, batch_size or settings.ORDER_TIMEOUT_BATCH_SIZE,
+                  now + settings.ORDER_TIMEOUT_CLAIM_LEASE]
+        )
+        if not claimed:
+            return {"claimed": 0, "cancelled": 0}
+
+        order_ids = sorted(int(member) for member in claimed)
+        candidates = [row.id for row in self.db.query(Order.id).filter(
+            Order.id.in_(order_ids), Order.status.in_(UNPAID_STATUSES))]
+
+        try:
+            cancelled = []
+            for order_id in candidates:
+                # 条件UPDATE：期间已支付或已取消的订单不会被修改
+                result = self.db.execute(
+                    update(Order)
+                    .where(Order.id == order_id, Order.status.in_(UNPAID_STATUSES))
+                    .values(status=OrderStatus.CANCELLED, version=Order.version + 1)
+                )
+                if result.rowcount == 1:
+                    cancelled.append(order_id)
+
+            if cancelled:
+                items = self.db.query(
+                    OrderItem.product_id, OrderItem.sku_id, OrderItem.quantity
+                ).filter(OrderItem.order_id.in_(cancelled))
+                InventoryService(self.db).restore(
+                    (item.product_id, item.sku_id, item.quantity) for item in items)
+                self.db.execute(insert(OrderLog), [{
+                    "order_id": order_id,
+                    "action": "cancel",
+                    "operator_type": 3,
+                    "operator_name": "system",
+                    "note": "支付超时自动取消"
+                } for order_id in cancelled])
+            self.db.commit()
+        except Exception:
+            # 不移出队列，租约到期后重试
+            self.db.rollback()
+            raise
+
+        self.unschedule(*order_ids)
+        logger.info(f"Cancelled expired orders: {len(cancelled)} of {len(order_ids)} claimed")
+        return {"claimed": len(order_ids), "cancelled": len(cancelled)}
+
+    def backfill(self, batch_size: int = None) -> int:
+        """把数据库中已有的未支付订单登记到到期队列(上线或Redis数据丢失后执行一次)"""
+        batch_size = batch_size or settings.ORDER_TIMEOUT_BATCH_SIZE
+        last_id = 0
+        total = 0
+        while True:
+            rows = self.db.query(Order.id, Order.created_at).filter(
+                Order.id > last_id, Order.status.in_(UNPAID_STATUSES)
+            ).order_by(Order.id).limit(batch_size).all()
+            if not rows:
+                break
+            self.schedule(rows)
+            last_id = rows[-1].id
+            total += len(rows)
+        logger.info(f"Scheduled {total} unpaid orders for payment timeout")
+        return total
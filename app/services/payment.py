@@ -4,15 +4,20 @@
 # @Date: 2025/5/3
 
 import time
-import hashlib
 import json
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional
+from redis.exceptions import RedisError
+from sqlalchemy import update, case, func, literal
 from sqlalchemy.orm import Session
 from app.models.payment import Payment, PaymentStatus, PaymentMethod
-from app.models.order import Order
+from app.models.order import Order, OrderStatus
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.snowflake import generate_payment_no
+from app.services.order_timeout import OrderTimeoutService
+from app.services.state_machine import order_state, payment_state, InvalidTransition
 import requests
 
 
@@ -36,9 +41,7 @@ class PaymentService:
 
     def generate_payment_no(self) -> str:
         """生成支付流水号"""
-        timestamp = int(time.time() * 1000)
-        rand_part = hashlib.md5(str(timestamp).encode()).hexdigest()[:6]
-        return f"PY{timestamp}{rand_part}"
+        return generate_payment_no()
 
     def process_payment(self, order_id: int):
         """处理支付(实际调用第三方支付)"""
@@ -57,20 +60,24 @@ class PaymentService:
         payment_result = self.call_payment_gateway(payment)
 
         # 更新支付状态
+        paid = False
         if payment_result["success"]:
-            payment.status = PaymentStatus.SUCCESS
-            payment.transaction_id = payment_result["transaction_id"]
-            payment.paid_time = datetime.now()
-            payment.payment_info = json.dumps(payment_result)
-
-            # 更新订单状态
-            order.status = 2  # 已付款
-            order.payment_time = datetime.now()
+            paid = self.mark_paid(payment, order, {
+                "transaction_id": payment_result["transaction_id"],
+                "paid_time": datetime.now(),
+                "payment_info": json.dumps(payment_result)
+            })
         else:
-            payment.status = PaymentStatus.FAILED
-            payment.payment_info = json.dumps(payment_result)
+            try:
+                payment_state.transition(self.db, payment, PaymentStatus.FAILED,
+                                         values={"payment_info": json.dumps(payment_result)}, allow_same=True)
+            except InvalidTransition:
+                # 期间回调已把支付置为成功，保留成功状态
+                logger.warning(f"Payment {payment.payment_no} already {payment.status.name}, failure ignored")
 
         self.db.commit()
+        if paid:
+            self.unschedule_timeout(order_id)
         return payment_result
 
     def call_payment_gateway(self, payment: Payment) -> dict:
@@ -111,31 +118,69 @@ class PaymentService:
 
         # 验证回调数据的真实性(实际项目中需要验证签名等)
         if self.verify_callback_data(data):
-            payment.status = PaymentStatus.SUCCESS
-            payment.transaction_id = data.get("transaction_id")
-            payment.paid_time = datetime.now()
-            payment.callback_time = datetime.now()
-            payment.callback_content = json.dumps(data)
-
-            # 更新订单状态
-            order = payment.order
-            order.status = 2  # 已付款
-            order.payment_time = datetime.now()
-
-            self.db.commit()
+            if self.apply_callback(payment, payment.order, data):
+                self.db.commit()
+                self.unschedule_timeout(payment.order_id)
             logger.info(f"Payment callback processed: {payment_no}")
             return True
         else:
             logger.error(f"Invalid callback data for payment: {payment_no}")
             return False
 
+    def apply_callback(self, payment: Payment, order: Order, data: dict) -> bool:
+        """把支付成功的回调写入支付记录和订单(不提交)，返回是否由本次完成支付"""
+        now = datetime.now()
+        return self.mark_paid(payment, order, {
+            "transaction_id": data.get("transaction_id"),
+            "paid_time": now,
+            "callback_time": now,
+            "callback_content": json.dumps(data)
+        })
+
+    def mark_paid(self, payment: Payment, order: Order, values: dict) -> bool:
+        """支付和订单转换为已支付(不提交)
+
+        并发的回调、对账和同步支付中只有一个会完成转换，其余返回False；
+        支付已关闭或订单已取消时记录错误并返回False，需要人工处理。
+        """
+        try:
+            if not payment_state.transition(self.db, payment, PaymentStatus.SUCCESS, values=values):
+                return False
+        except InvalidTransition as e:
+            logger.error(f"Payment {payment.payment_no} paid in {payment.status.name} state: {str(e)}")
+            return False
+
+        try:
+            order_state.transition(self.db, order, OrderStatus.PAID, values={"payment_time": values["paid_time"]})
+        except InvalidTransition as e:
+            # 如超时取消后才支付成功，订单保持原状态，需要退款
+            logger.error(f"Order {order.id} paid in {order.status.name} state: {str(e)}")
+        return True
+
+    @staticmethod
+    def unschedule_timeout(*order_ids: int):
+        """已支付的订单移出支付超时队列
+
+        在提交之后调用，Redis不可用时只记录日志：到期时已支付的订单不会被取消，
+        不能因此让已完成的支付返回错误。
+        """
+        try:
+            OrderTimeoutService().unschedule(*order_ids)
+        except RedisError as e:
+            logger.warning(f"Unschedule payment timeout failed for orders {list(order_ids)}: {str(e)}")
+
     def verify_callback_data(self, data: dict) -> bool:
         """验证回调数据(模拟)"""
         # 实际项目中需要根据支付平台的要求验证签名等
         return True
 
     def refund(self, order_id: int, amount: Optional[float] = None) -> dict:
-        """退款"""
+        """退款
+
+        调用网关前先用条件UPDATE占用退款额度，超额和并发的重复退款在这一步被拒绝；
+        网关明确失败时释放额度，结果未知(异常)时保留额度等待人工核对，
+        网关已完成的退款不会因为状态冲突而丢失。
+        """
         order = self.db.query(Order).get(order_id)
         if not order or not order.payment:
             raise ValueError("订单或支付记录不存在")
@@ -145,25 +190,81 @@ class PaymentService:
             raise ValueError("只有已支付的订单可以退款")
 
         if amount is None:
-            amount = payment.amount
-        else:
-            if amount > payment.amount - payment.refund_amount:
-                raise ValueError("退款金额超过可退金额")
+            amount = payment.amount - (payment.refund_amount or 0)
+        amount = Decimal(str(amount))
+        if amount <= 0:
+            raise ValueError("退款金额必须大于0")
 
-        # 调用第三方退款API
-        refund_result = self.call_refund_gateway(payment, amount)
+        if not self._reserve_refund(payment, amount):
+            self.db.rollback()
+            raise ValueError("退款金额超过可退金额")
+        self.db.commit()
 
-        if refund_result["success"]:
-            payment.refund_amount += amount
-            payment.refund_time = datetime.now()
+        # 调用第三方退款API
+        try:
+            refund_result = self.call_refund_gateway(payment, amount)
+        except Exception:
+            logger.error(f"Refund gateway error for payment {payment.payment_no}, "
+                         f"amount {amount} kept reserved for manual check")
+            raise
 
-            # 更新订单状态
-            if payment.refund_amount >= payment.amount:
-                order.status = 6  # 退款中
+        if not refund_result["success"]:
+            self._release_refund(payment, amount)
             self.db.commit()
+            return refund_result
+
+        # 更新订单状态
+        if self._complete_refund(payment):
+            try:
+                order_state.transition(self.db, order, OrderStatus.REFUNDING)
+            except InvalidTransition as e:
+                logger.warning(f"Order {order.id} not moved to REFUNDING: {str(e)}")
+        self.db.commit()
 
         return refund_result
 
+    def _reserve_refund(self, payment: Payment, amount: Decimal) -> bool:
+        """在SQL中累加退款金额，累计不超过支付金额时才更新"""
+        table = Payment.__table__
+        refunded = func.coalesce(table.c.refund_amount, 0)
+        result = self.db.execute(
+            update(table)
+            .where(table.c.id == payment.id,
+                   table.c.status == PaymentStatus.SUCCESS,
+                   refunded + amount <= table.c.amount)
+            .values(refund_amount=refunded + amount, version=table.c.version + 1)
+        )
+        self.db.expire(payment)
+        return result.rowcount == 1
+
+    def _release_refund(self, payment: Payment, amount: Decimal):
+        table = Payment.__table__
+        self.db.execute(
+            update(table)
+            .where(table.c.id == payment.id)
+            .values(refund_amount=table.c.refund_amount - amount, version=table.c.version + 1)
+        )
+        self.db.expire(payment)
+
+    def _complete_refund(self, payment: Payment) -> bool:
+        """记录退款时间，已全额退款时在同一条UPDATE中转为REFUNDED，返回是否本次转为REFUNDED"""
+        table = Payment.__table__
+        result = self.db.execute(
+            update(table)
+            .where(table.c.id == payment.id, table.c.status == PaymentStatus.SUCCESS)
+            .values(
+                status=case(
+                    (table.c.refund_amount >= table.c.amount,
+                     literal(PaymentStatus.REFUNDED, type_=table.c.status.type)),
+                    else_=table.c.status
+                ),
+                refund_time=datetime.now(),
+                version=table.c.version + 1
+            )
+        )
+        self.db.expire(payment)
+        return result.rowcount == 1 and payment.status == PaymentStatus.REFUNDED
+
     def call_refund_gateway(self, payment: Payment, amount: float) -> dict:
         """调用第三方退款网关(模拟)"""
         logger.info(f"Calling refund gateway for payment: {payment.payment_no}, amount: {amount}")
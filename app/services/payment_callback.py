@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/21
+
+import json
+import os
+import socket
+from redis.exceptions import ResponseError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.models.order import Order
+from app.models.payment import Payment
+from app.services.payment import PaymentService
+
+
+class PaymentCallbackService:
+    """支付回调异步处理
+
+    回调接口只验签并写入Redis Stream后立即应答；消费者按批读取，同一批中重复的
+    payment_no只处理一次，支付和订单各用一次IN查询加载，整批提交一次后再ACK。
+    消费者中途退出时未ACK的消息超过PAYMENT_CALLBACK_CLAIM_IDLE毫秒后被重新认领。
+    """
+
+    STREAM_KEY = "payment:callbacks"
+    GROUP = "payment-callback-workers"
+
+    def __init__(self, db: Session = None):
+        self.db = db
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+
+    def enqueue(self, payment_no: str, data: dict) -> str:
+        """持久化回调通知，返回消息ID"""
+        return redis_client.xadd(self.STREAM_KEY, {
+            "payment_no": payment_no,
+            "data": json.dumps(data)
+        })
+
+    def consume(self, batch_size: int = None) -> dict:
+        """读取并处理一批回调通知"""
+        self.ensure_group()
+        batch_size = batch_size or settings.PAYMENT_CALLBACK_BATCH_SIZE
+
+        entries = self.claim_stale(batch_size)
+        if not entries:
+            response = redis_client.xreadgroup(self.GROUP, self.consumer, {self.STREAM_KEY: ">"},
+                                               count=batch_size)
+            entries = response[0][1] if response else []
+        if not entries:
+            return {"received": 0, "applied": 0}
+
+        applied = self.apply_batch(entries)
+
+        # 提交后才确认，处理过的消息从Stream中删除
+        message_ids = [message_id for message_id, _ in entries]
+        pipeline = redis_client.pipeline()
+        pipeline.xack(self.STREAM_KEY, self.GROUP, *message_ids)
+        pipeline.xdel(self.STREAM_KEY, *message_ids)
+        pipeline.execute()
+        return {"received": len(entries), "applied": applied}
+
+    def ensure_group(self):
+        try:
+            redis_client.xgroup_create(self.STREAM_KEY, self.GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def claim_stale(self, count: int) -> list:
+        """认领其他消费者超时未确认的消息"""
+        pending = redis_client.xpending_range(self.STREAM_KEY, self.GROUP, "-", "+", count)
+        stale = [entry["message_id"] for entry in pending
+                 if entry["time_since_delivered"] >= settings.PAYMENT_CALLBACK_CLAIM_IDLE]
+        if not stale:
+            return []
+        return redis_client.xclaim(self.STREAM_KEY, self.GROUP, self.consumer,
+                                   settings.PAYMENT_CALLBACK_CLAIM_IDLE, stale)
+
+    def apply_batch(self, entries: list) -> int:
+        """把一批回调写入数据库，一次提交，返回更新的支付数"""
+        callbacks = {}
+        for message_id, fields in entries:
+            try:
+                payment_no, data = fields["payment_no"], json.loads(fields["data"])
+            except (KeyError, TypeError, ValueError):
+                logger.error(f"Malformed payment callback message: {message_id}")
+                continue
+            # 同一支付的重复通知只处理第一条
+            callbacks.setdefault(payment_no, data)
+        if not callbacks:
+            return 0
+
+        payments = self.db.query(Payment).filter(Payment.payment_no.in_(list(callbacks))).all()
+        orders = {order.id: order for order in self.db.query(Order).filter(
+            Order.id.in_({payment.order_id for payment in payments}))}
+
+        service = PaymentService(self.db)
+        paid_order_ids = []
+        for payment in payments:
+            # 已被同步支付或对账抢先的支付直接跳过
+            if service.apply_callback(payment, orders[payment.order_id], callbacks[payment.payment_no]):
+                paid_order_ids.append(payment.order_id)
+
+        missing = set(callbacks) - {payment.payment_no for payment in payments}
+        if missing:
+            logger.error(f"Payments not found for callbacks: {sorted(missing)}")
+
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        service.unschedule_timeout(*paid_order_ids)
+        logger.info(f"Applied {len(paid_order_ids)} payment callbacks from {len(entries)} messages")
+        return len(paid_order_ids)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/22
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.models.order import Order
+from app.models.payment import Payment, PaymentStatus, PaymentMethod
+from app.services.payment import PaymentService
+from app.services.state_machine import payment_state, InvalidTransition
+from app.services.wechat_pay import WeChatPayService
+
+# 微信订单查询trade_state -> 对账结果
+PAID_STATES = {"SUCCESS"}
+CLOSED_STATES = {"CLOSED", "REVOKED", "PAYERROR"}
+
+
+class RateLimiter:
+    """令牌桶限速，多线程共用"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PaymentReconciliationService:
+    """待支付记录对账
+
+    按主键游标分页扫描超过PAYMENT_RECONCILE_AFTER_MINUTES仍为PENDING的支付，
+    以有限并发和限速向支付平台查询，每页的结果按回调的语义批量写入，一次提交。
+    """
+
+    LOCK_KEY = "payment_reconcile:lock"
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.wechat = WeChatPayService()
+        self.limiter = RateLimiter(settings.PAYMENT_RECONCILE_RATE)
+
+    def run(self, page_size: int = None, max_pages: int = None) -> dict:
+        page_size = page_size or settings.PAYMENT_RECONCILE_PAGE_SIZE
+        max_pages = max_pages or settings.PAYMENT_RECONCILE_MAX_PAGES
+        stats = {"scanned": 0, "paid": 0, "closed": 0, "pending": 0, "errors": 0}
+
+        lock = redis_client.lock(self.LOCK_KEY, timeout=3600)
+        if not lock.acquire(blocking=False):
+            logger.info("Payment reconciliation already running, skipped")
+            return stats
+
+        start = time.monotonic()
+        cutoff = datetime.now() - timedelta(minutes=settings.PAYMENT_RECONCILE_AFTER_MINUTES)
+        last_id = 0
+        try:
+            with ThreadPoolExecutor(max_workers=settings.PAYMENT_RECONCILE_CONCURRENCY) as executor:
+                for _ in range(max_pages):
+                    page = self.db.query(Payment.id, Payment.payment_no).filter(
+                        Payment.id > last_id,
+                        Payment.status == PaymentStatus.PENDING,
+                        Payment.method == PaymentMethod.WECHAT,
+                        Payment.created_at < cutoff
+                    ).order_by(Payment.id).limit(page_size).all()
+                    if not page:
+                        break
+                    last_id = page[-1].id
+
+                    results = list(executor.map(self.query, [row.payment_no for row in page]))
+                    stats["scanned"] += len(page)
+                    stats["errors"] += sum(1 for result in results if result is None)
+                    page_stats = self.apply(
+                        {row.id: result for row, result in zip(page, results) if result is not None})
+                    for key, value in page_stats.items():
+                        stats[key] += value
+                    if len(page) < page_size:
+                        break
+        finally:
+            lock.release()
+
+        stats["elapsed"] = round(time.monotonic() - start, 2)
+        logger.info(f"Payment reconciliation: {stats}")
+        return stats
+
+    def query(self, payment_no: str):
+        """查询一笔支付，失败返回None"""
+        self.limiter.acquire()
+        try:
+            result = self.wechat.query_order(payment_no)
+        except Exception as e:
+            logger.warning(f"Reconcile query failed for {payment_no}: {str(e)}")
+            return None
+        if result.get("return_code") != "SUCCESS" or result.get("result_code") != "SUCCESS":
+            # ORDERNOTEXIST等业务错误，本轮不处理
+            logger.warning(f"Reconcile query error for {payment_no}: {result.get('err_code') or result.get('return_msg')}")
+            return None
+        return result
+
+    def apply(self, results: dict) -> dict:
+        """按查询结果批量更新一页支付，一次提交"""
+        stats = {"paid": 0, "closed": 0, "pending": 0}
+        if not results:
+            return stats
+
+        # 查询期间可能已收到回调，只处理仍为PENDING的记录
+        payments = self.db.query(Payment).filter(
+            Payment.id.in_(list(results)), Payment.status == PaymentStatus.PENDING).all()
+        orders = {order.id: order for order in self.db.query(Order).filter(
+            Order.id.in_({payment.order_id for payment in payments}))}
+
+        service = PaymentService(self.db)
+        paid_order_ids = []
+        for payment in payments:
+            result = results[payment.id]
+            trade_state = result.get("trade_state")
+            if trade_state in PAID_STATES:
+                if service.apply_callback(payment, orders[payment.order_id], result):
+                    paid_order_ids.append(payment.order_id)
+                    stats["paid"] += 1
+            elif trade_state in CLOSED_STATES:
+                target = PaymentStatus.CLOSED if trade_state != "PAYERROR" else PaymentStatus.FAILED
+                try:
+                    if payment_state.transition(self.db, payment, target):
+                        stats["closed"] += 1
+                except InvalidTransition:
+                    # 期间收到了支付成功的回调
+                    logger.warning(f"Reconcile skipped {payment.payment_no}: already {payment.status.name}")
+            else:
+                stats["pending"] += 1
+
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        service.unschedule_timeout(*paid_order_ids)
+        return stats
@@ -3,10 +3,134 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
+import re
+import time
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.core.elasticsearch import es_service
-from app.crud.product import get_product
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.elasticsearch import es_service, async_es_service, es_breaker
 from app.core.logging import logger
+from app.core.redis import redis_client
+
+
+class SearchResultCache(TTLCache):
+    """搜索结果缓存
+
+    键为规范化后的(q, category_id, min_price, max_price, page, page_size, facets)，
+    同时按结果中的商品ID和分类ID建立反向索引，商品变更时只失效相关条目。
+    缓存在进程内：增量同步把变更写入ES后向Redis Stream发布失效事件，各worker在
+    读缓存时(至多每SEARCH_CACHE_INVALIDATION_POLL秒一次)读取并失效相关条目。
+    """
+
+    INVALIDATION_KEY = "search_cache:invalidations"
+    INVALIDATION_MAXLEN = 10000
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self._keys_by_product = {}
+        self._keys_by_category = {}
+        self._last_event_id = None
+        self._next_poll_at = 0
+
+    def get(self, key):
+        self.poll_invalidations()
+        return super().get(key)
+
+    @classmethod
+    def publish_invalidations(cls, products, clear: bool = False):
+        """发布失效事件，products为(product_id, category_id)；clear为True时清空全部缓存"""
+        pipeline = redis_client.pipeline()
+        if clear:
+            pipeline.xadd(cls.INVALIDATION_KEY, {"all": 1},
+                          maxlen=cls.INVALIDATION_MAXLEN, approximate=True)
+        for product_id, category_id in products:
+            pipeline.xadd(cls.INVALIDATION_KEY, {"product_id": product_id, "category_id": category_id or 0},
+                          maxlen=cls.INVALIDATION_MAXLEN, approximate=True)
+        pipeline.execute()
+
+    def poll_invalidations(self):
+        """读取上次以来的失效事件；Redis不可用时跳过，条目依靠TTL过期"""
+        now = time.monotonic()
+        if now < self._next_poll_at:
+            return
+        self._next_poll_at = now + settings.SEARCH_CACHE_INVALIDATION_POLL
+        try:
+            if self._last_event_id is None:
+                # 启动前的事件与本进程缓存无关，从最新一条之后开始读
+                latest = redis_client.xrevrange(self.INVALIDATION_KEY, count=1)
+                self._last_event_id = latest[0][0] if latest else "0-0"
+                return
+            while True:
+                response = redis_client.xread({self.INVALIDATION_KEY: self._last_event_id}, count=1000)
+                entries = response[0][1] if response else []
+                for event_id, fields in entries:
+                    if fields.get("all"):
+                        self.clear()
+                    else:
+                        self.invalidate_product(fields["product_id"], [int(fields["category_id"])])
+                    self._last_event_id = event_id
+                if len(entries) < 1000:
+                    break
+        except Exception as e:
+            logger.warning(f"Search cache invalidation poll failed: {str(e)}")
+
+    @staticmethod
+    def make_key(query: str, category_id: int = None,
+                 min_price: float = None, max_price: float = None,
+                 page: int = 1, page_size: int = 20, facets: bool = False) -> tuple:
+        return (
+            " ".join((query or "").lower().split()),
+            int(category_id) if category_id else None,
+            float(min_price) if min_price is not None else None,
+            float(max_price) if max_price is not None else None,
+            page,
+            page_size,
+            facets
+        )
+
+    def invalidate_product(self, product_id: int, category_ids=()):
+        """失效包含该商品的结果，以及可能因该商品变化而改变的分类结果"""
+        with self._lock:
+            keys = set(self._keys_by_product.get(str(product_id), ()))
+            # 不带分类过滤的结果也可能受影响
+            for category_id in set(category_ids) | {None}:
+                keys |= self._keys_by_category.get(
+                    int(category_id) if category_id else None, set())
+            for key in keys:
+                self.delete(key)
+
+    def _on_set(self, key, value):
+        self._keys_by_category.setdefault(key[1], set()).add(key)
+        for product in value["products"]:
+            self._keys_by_product.setdefault(str(product["id"]), set()).add(key)
+
+    def _on_remove(self, key, value):
+        self._discard(self._keys_by_category, key[1], key)
+        for product in value["products"]:
+            self._discard(self._keys_by_product, str(product["id"]), key)
+
+    @staticmethod
+    def _discard(index: dict, index_key, key):
+        keys = index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[index_key]
+
+
+# 全局实例
+search_cache = SearchResultCache(
+    max_size=settings.SEARCH_CACHE_MAX_SIZE,
+    ttl=settings.SEARCH_CACHE_TTL
+)
+
+# 分面统计缓存，键为筛选条件(不含分页)，同一筛选条件翻页时不再计算聚合
+facet_cache = TTLCache(
+    max_size=settings.SEARCH_CACHE_MAX_SIZE,
+    ttl=settings.SEARCH_FACET_CACHE_TTL
+)
 
 
 class SearchService:
@@ -15,47 +139,111 @@ class SearchService:
 
     def search_products(self, query: str, category_id: int = None,
                         min_price: float = None, max_price: float = None,
-                        page: int = 1, page_size: int = 20):
+                        page: int = 1, page_size: int = 20, cursor: str = None,
+                        facets: bool = False):
         """搜索商品"""
+        # 游标翻页的结果依赖point-in-time，不做缓存
+        cache_key = None
+        if cursor is None:
+            cache_key = search_cache.make_key(
+                query, category_id, min_price, max_price, page, page_size, facets)
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        facet_key, cached_facets = self.get_cached_facets(
+            facets, query, category_id, min_price, max_price)
+
         try:
-            result = es_service.search_products(
+            result = es_breaker.call(
+                es_service.search_products,
                 query=query,
                 category_id=category_id,
                 min_price=min_price,
                 max_price=max_price,
                 page=page,
-                page_size=page_size
+                page_size=page_size,
+                cursor=cursor,
+                facets=facets and cached_facets is None
             )
 
-            # 可以从数据库补充更多信息
-            for product in result["products"]:
-                db_product = get_product(self.db, product["id"])
-                if db_product:
-                    product["image_url"] = db_product.main_image_url
-                    product["stock"] = db_product.stock
+            # 从数据库补充更多信息
+            self.enrich_products(result["products"])
+            if facets:
+                self.attach_facets(result, facet_key, cached_facets)
 
+            if cache_key is not None:
+                search_cache.set(cache_key, result)
             return result
+        except ValueError:
+            raise
+        except CircuitOpenError:
+            # 熔断打开，直接回退，不再等待ES超时
+            return self.fallback_search(
+                query, category_id, min_price, max_price, page, page_size)
         except Exception as e:
             logger.error(f"Search error: {str(e)}")
             # 失败时回退到数据库搜索
             return self.fallback_search(
                 query, category_id, min_price, max_price, page, page_size)
 
+    @staticmethod
+    def get_cached_facets(facets: bool, query: str, category_id: int = None,
+                          min_price: float = None, max_price: float = None):
+        """返回(分面缓存键, 已缓存的分面)，不需要分面时均为None"""
+        if not facets:
+            return None, None
+        facet_key = search_cache.make_key(query, category_id, min_price, max_price)[:4]
+        return facet_key, facet_cache.get(facet_key)
+
+    @staticmethod
+    def attach_facets(result: dict, facet_key: tuple, cached_facets: dict):
+        if cached_facets is not None:
+            result["facets"] = cached_facets
+        elif "facets" in result:
+            facet_cache.set(facet_key, result["facets"])
+
+    def enrich_products(self, products: list):
+        """一次IN查询补充图片和库存，按命中顺序回填"""
+        from app.models.product import Product
+
+        if not products:
+            return products
+
+        ids = [int(product["id"]) for product in products]
+        rows = self.db.query(
+            Product.id, Product.main_image_url, Product.stock
+        ).filter(Product.id.in_(ids)).all()
+        rows_by_id = {row.id: row for row in rows}
+
+        for product in products:
+            row = rows_by_id.get(int(product["id"]))
+            if row:
+                product["image_url"] = row.main_image_url
+                product["stock"] = row.stock
+
+        return products
+
     def fallback_search(self, query: str, category_id: int = None,
                         min_price: float = None, max_price: float = None,
                         page: int = 1, page_size: int = 20):
-        """数据库回退搜索"""
-        from sqlalchemy import or_
+        """数据库回退搜索
+
+        关键词走products上的FULLTEXT(ngram)索引，总数通过窗口函数与分页数据
+        一次查询返回，避免ES故障时对数据库做全表扫描。
+        """
+        from sqlalchemy import func
+        from sqlalchemy.dialects.mysql import match
         from app.models.product import Product
 
-        query_obj = self.db.query(Product).filter(Product.status == 1)
+        query_obj = self.db.query(
+            Product, func.count().over().label("total")
+        ).filter(Product.status == 1)
 
-        if query:
+        keywords = self.fulltext_keywords(query)
+        if keywords:
             query_obj = query_obj.filter(
-                or_(
-                    Product.name.like(f"%{query}%"),
-                    Product.description.like(f"%{query}%")
-                )
+                match(Product.name, Product.description, against=keywords).in_boolean_mode()
             )
 
         if category_id:
@@ -67,8 +255,15 @@ class SearchService:
         if max_price is not None:
             query_obj = query_obj.filter(Product.price <= max_price)
 
-        total = query_obj.count()
-        products = query_obj.offset((page - 1) * page_size).limit(page_size).all()
+        rows = query_obj.offset((page - 1) * page_size).limit(page_size).all()
+        products = [row.Product for row in rows]
+        if rows:
+            total = rows[0].total
+        elif page > 1:
+            # 超出最后一页时窗口函数拿不到总数，单独统计
+            total = query_obj.with_entities(func.count(Product.id)).scalar()
+        else:
+            total = 0
 
         return {
             "total": total,
@@ -86,12 +281,178 @@ class SearchService:
             "page_size": page_size
         }
 
-    def index_all_products(self):
-        """索引所有商品"""
+    @staticmethod
+    def fulltext_keywords(query: str) -> str:
+        """把用户输入转换为BOOLEAN MODE表达式：每个词作为必须出现的短语
+
+        ngram解析器下短语匹配要求所有分词连续出现，与原先的LIKE子串语义一致。
+        全文索引按ngram_token_size=1建立，单字词(如"鞋")同样走索引；
+        短于SEARCH_NGRAM_TOKEN_SIZE的词不在索引中，忽略而不是退回全表扫描。
+        """
+        words = re.sub(r'[+\-<>()~*"@]', " ", query or "").split()
+        return " ".join(f'+"{word}"' for word in words
+                        if len(word) >= settings.SEARCH_NGRAM_TOKEN_SIZE)
+
+    def index_all_products(self, chunk_size: int = None, thread_count: int = None,
+                           index: str = None):
+        """分批全量索引商品
+
+        按主键游标分批读取商品(每批预加载SKU)，在生成器中构建文档，通过_bulk接口
+        并发写入，内存占用与商品总数无关。index为空时写入当前别名。
+        """
+        actions = (es_service.build_index_action(product, index)
+                   for product in self.iter_products(settings.ES_REINDEX_FETCH_SIZE))
+
+        result = es_service.bulk(
+            actions,
+            chunk_size=chunk_size or settings.ES_BULK_CHUNK_SIZE,
+            thread_count=thread_count or settings.ES_BULK_THREAD_COUNT
+        )
+        total = result["success"] + result["errors"]
+        result["total"] = total
+        result["rate"] = total / result["elapsed"] if result["elapsed"] else 0
+
+        logger.info(
+            f"Indexed {result['success']}/{total} products, "
+            f"{result['errors']} errors, {result['elapsed']:.1f}s, "
+            f"{result['rate']:.0f} docs/s")
+        return result
+
+    def iter_products(self, fetch_size: int):
+        """按 id > last_id ORDER BY id LIMIT n 分页读取全部商品
+
+        不使用服务端游标：pymysql同一连接上只能有一个未读完的结果集，
+        selectinload的SKU查询会把流式游标的剩余结果丢弃。
+        """
+        from sqlalchemy.orm import selectinload
         from app.models.product import Product
 
-        products = self.db.query(Product).all()
-        for product in products:
-            es_service.index_product(product)
+        last_id = 0
+        while True:
+            page = (
+                self.db.query(Product)
+                .options(selectinload(Product.skus))
+                .filter(Product.id > last_id)
+                .order_by(Product.id)
+                .limit(fetch_size)
+                .all()
+            )
+            if not page:
+                break
+            last_id = page[-1].id
+            yield from page
+            # 已索引的商品不再保留在Session中
+            for product in page:
+                self.db.expunge(product)
+            if len(page) < fetch_size:
+                break
+
+    def rebuild_index(self, keep_old: bool = False):
+        """零停机重建索引
+
+        写入新的物理索引(批量写入期间关闭刷新和副本)，完成后恢复设置，文档数与数据库
+        一致时才原子切换别名。重建期间的增量变更写入的是旧索引，切换后在增量同步锁内
+        把水位重置到开始时间重放一遍，避免正在运行的同步用更晚的水位覆盖。
+        """
+        from datetime import timedelta
+        from sqlalchemy import func
+        from app.models.product import Product
+        from app.services.search_sync import SearchSyncService
+
+        # 与增量同步一样留出晚提交事务的余量
+        started_at = self.db.query(func.now()).scalar() - timedelta(
+            seconds=settings.SEARCH_SYNC_LAG_SECONDS)
+        new_index = es_service.create_versioned_index()
+        sync = SearchSyncService(self.db)
+        lock = sync.lock()
+        try:
+            result = self.index_all_products(index=new_index)
+            if result["errors"]:
+                raise RuntimeError(f"Reindex into {new_index} failed with {result['errors']} errors")
+            es_service.finish_bulk_load(new_index)
+
+            if not lock.acquire(blocking_timeout=300):
+                raise RuntimeError("Timed out waiting for the search sync lock")
+        except Exception:
+            es_service.delete_indices([new_index])
+            raise
+
+        try:
+            # 文档数不一致(如读取中断)时保留旧索引
+            indexed = es_service.count(new_index)
+            expected = self.db.query(func.count(Product.id)).scalar()
+            if indexed != expected:
+                es_service.delete_indices([new_index])
+                raise RuntimeError(
+                    f"Reindex into {new_index} has {indexed} documents, expected {expected}; alias not switched")
+
+            old_indices = es_service.swap_alias(new_index)
+            sync.reset_watermark(started_at)
+            search_cache.publish_invalidations([], clear=True)
+        finally:
+            lock.release()
+
+        if not keep_old:
+            es_service.delete_indices(old_indices)
+
+        result["index"] = new_index
+        result["count"] = indexed
+        return result
+
+
+class AsyncSearchService(SearchService):
+    """异步搜索服务
+
+    ES调用走AsyncElasticsearch，不占用线程池；数据库补充和回退搜索仍使用
+    同步Session，放到线程池中执行。
+    """
+
+    async def search_products(self, query: str, category_id: int = None,
+                              min_price: float = None, max_price: float = None,
+                              page: int = 1, page_size: int = 20, cursor: str = None,
+                              facets: bool = False):
+        """搜索商品"""
+        # 游标翻页的结果依赖point-in-time，不做缓存
+        cache_key = None
+        if cursor is None:
+            cache_key = search_cache.make_key(
+                query, category_id, min_price, max_price, page, page_size, facets)
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        facet_key, cached_facets = self.get_cached_facets(
+            facets, query, category_id, min_price, max_price)
+
+        try:
+            result = await es_breaker.call_async(
+                async_es_service.search_products,
+                query=query,
+                category_id=category_id,
+                min_price=min_price,
+                max_price=max_price,
+                page=page,
+                page_size=page_size,
+                cursor=cursor,
+                facets=facets and cached_facets is None
+            )
+        except ValueError:
+            raise
+        except CircuitOpenError:
+            # 熔断打开，直接回退，不再等待ES超时
+            return await run_in_threadpool(
+                self.fallback_search, query, category_id, min_price, max_price, page, page_size)
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            # 失败时回退到数据库搜索
+            return await run_in_threadpool(
+                self.fallback_search, query, category_id, min_price, max_price, page, page_size)
+
+        # 从数据库补充更多信息
+        await run_in_threadpool(self.enrich_products, result["products"])
+        if facets:
+            self.attach_facets(result, facet_key, cached_facets)
 
-        logger.info(f"Indexed {len(products)} products")
\ No newline at end of file
+        if cache_key is not None:
+            search_cache.set(cache_key, result)
+        return result
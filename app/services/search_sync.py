@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/8
+
+from datetime import datetime
+from sqlalchemy import and_, or_, func, literal_column
+from sqlalchemy.orm import Session, selectinload
+from app.core.config import settings
+from app.core.elasticsearch import es_service
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.models.product import Product, ProductSku
+from app.services.search import search_cache
+
+
+class SearchSyncService:
+    """增量同步商品索引
+
+    按(updated_at, id)高水位分别扫描products和product_skus的变更，
+    批量写入ES：上架商品upsert，下架或已删除的商品从索引中删除。
+    写入失败的商品ID记入重试集合，水位照常推进，每轮同步先重试这些商品。
+    """
+
+    WATERMARK_KEY = "search_sync:watermark:{source}"
+    LOCK_KEY = "search_sync:lock"
+    RETRY_KEY = "search_sync:retry"
+
+    SOURCES = (
+        ("products", Product, Product.id),
+        ("product_skus", ProductSku, ProductSku.product_id),
+    )
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def sync_changes(self, batch_size: int = None) -> dict:
+        """同步自上次水位以来的所有变更"""
+        batch_size = batch_size or settings.SEARCH_SYNC_BATCH_SIZE
+        stats = {"products": 0, "success": 0, "errors": 0}
+
+        # 同一时间只允许一个同步任务推进水位
+        lock = self.lock()
+        if not lock.acquire(blocking=False):
+            logger.info("Search sync already running, skipped")
+            return stats
+
+        try:
+            self.add_stats(stats, self.retry_failed(batch_size))
+            for source, model, product_id_column in self.SOURCES:
+                while True:
+                    rows = self.fetch_changes(source, model, product_id_column, batch_size)
+                    if not rows:
+                        break
+
+                    result = self.sync_products({row.product_id for row in rows})
+                    self.add_stats(stats, result)
+                    # 失败的商品先记入重试集合，再推进水位
+                    self.mark_failed(result["failed"])
+
+                    last = rows[-1]
+                    self.save_watermark(source, last.updated_at, last.id)
+                    if len(rows) < batch_size:
+                        break
+        finally:
+            lock.release()
+
+        if stats["products"]:
+            logger.info(f"Search sync: {stats}")
+        return stats
+
+    def lock(self):
+        """推进或重置水位前需要持有的锁"""
+        return redis_client.lock(self.LOCK_KEY, timeout=300)
+
+    @staticmethod
+    def add_stats(stats: dict, result: dict):
+        stats["products"] += result["success"] + result["errors"]
+        stats["success"] += result["success"]
+        stats["errors"] += result["errors"]
+
+    def retry_failed(self, batch_size: int) -> dict:
+        """重试一批之前写入失败的商品，成功的移出重试集合"""
+        product_ids = {int(product_id) for product_id in
+                       redis_client.srandmember(self.RETRY_KEY, batch_size)}
+        if not product_ids:
+            return {"success": 0, "errors": 0, "failed": []}
+
+        result = self.sync_products(product_ids)
+        succeeded = product_ids - {int(product_id) for product_id in result["failed"]}
+        if succeeded:
+            redis_client.srem(self.RETRY_KEY, *succeeded)
+        return result
+
+    def mark_failed(self, product_ids):
+        """记录需要重试的商品，下一轮同步时重新写入ES"""
+        product_ids = [int(product_id) for product_id in product_ids if product_id is not None]
+        if product_ids:
+            redis_client.sadd(self.RETRY_KEY, *product_ids)
+
+    def fetch_changes(self, source: str, model, product_id_column, batch_size: int) -> list:
+        """按(updated_at, id)取水位之后的一批变更"""
+        # 只取数据库时间SEARCH_SYNC_LAG_SECONDS之前的变更，晚提交的事务下一轮仍能取到
+        upper_bound = func.date_sub(
+            func.now(),
+            literal_column(f"INTERVAL {int(settings.SEARCH_SYNC_LAG_SECONDS)} SECOND")
+        )
+        query = self.db.query(
+            model.id, model.updated_at, product_id_column.label("product_id")
+        ).filter(model.updated_at <= upper_bound)
+
+        updated_at, last_id = self.load_watermark(source)
+        if updated_at is not None:
+            query = query.filter(or_(
+                model.updated_at > updated_at,
+                and_(model.updated_at == updated_at, model.id > last_id)
+            ))
+
+        return query.order_by(model.updated_at, model.id).limit(batch_size).all()
+
+    def sync_products(self, product_ids) -> dict:
+        """把指定商品的当前状态批量写入ES"""
+        product_ids = list(product_ids)
+        products = (
+            self.db.query(Product)
+            .options(selectinload(Product.skus))
+            .filter(Product.id.in_(product_ids))
+            .all()
+        )
+
+        actions = []
+        for product in products:
+            if product.status == 1:
+                actions.append(es_service.build_index_action(product))
+            else:
+                # 下架商品与delete_product语义一致，从索引中删除
+                actions.append(es_service.build_delete_action(product.id))
+
+        found = {product.id for product in products}
+        for product_id in product_ids:
+            if product_id not in found:
+                actions.append(es_service.build_delete_action(product_id))
+
+        result = es_service.bulk(actions)
+        # ES已更新，通知各web worker失效相关的搜索结果缓存
+        try:
+            search_cache.publish_invalidations(
+                [(product.id, product.category_id) for product in products] +
+                [(product_id, None) for product_id in product_ids if product_id not in found])
+        except Exception as e:
+            logger.warning(f"Failed to publish search cache invalidations: {str(e)}")
+        return result
+
+    def load_watermark(self, source: str):
+        value = redis_client.get(self.WATERMARK_KEY.format(source=source))
+        if not value:
+            return None, 0
+        updated_at, last_id = value.rsplit("|", 1)
+        return datetime.fromisoformat(updated_at), int(last_id)
+
+    def save_watermark(self, source: str, updated_at, last_id: int):
+        redis_client.set(
+            self.WATERMARK_KEY.format(source=source),
+            f"{updated_at.isoformat()}|{last_id}"
+        )
+
+    def reset_watermark(self, updated_at=None):
+        """重置水位，updated_at为空时下次同步从头开始"""
+        for source, _, _ in self.SOURCES:
+            key = self.WATERMARK_KEY.format(source=source)
+            if updated_at is None:
+                redis_client.delete(key)
+            else:
+                redis_client.set(key, f"{updated_at.isoformat()}|0")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/12
+
+import json
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.redis import redis_client
+from app.core.snowflake import generate_order_no
+from app.models.address import Address
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product, ProductSku
+from app.services.inventory import InventoryService
+from app.services.order_timeout import OrderTimeoutService
+
+
+class ReservationStatus:
+    PENDING = "pending"  # 已抢到，订单生成中
+    CREATED = "created"  # 订单已生成
+    FAILED = "failed"  # 订单生成失败
+
+
+# 原子地校验并扣减秒杀库存，抢到后写入待生成订单队列
+# KEYS: 库存, 已购用户集合, 订单队列, 抢购凭证
+# ARGV: 用户ID, 数量, 队列条目, 凭证状态, 凭证过期时间
+RESERVE_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then
+    return -1
+end
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    return -2
+end
+local quantity = tonumber(ARGV[2])
+if tonumber(stock) < quantity then
+    return 0
+end
+redis.call('DECRBY', KEYS[1], quantity)
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('RPUSH', KEYS[3], ARGV[3])
+redis.call('SET', KEYS[4], ARGV[4], 'EX', ARGV[5])
+return 1
+"""
+
+# 从订单队列取一批移入处理中队列；处理中队列非空(上次消费未完成)时先返回其中的条目
+# KEYS: 订单队列, 处理中队列
+# ARGV: 批大小
+TAKE_BATCH_SCRIPT = """
+local pending = redis.call('LRANGE', KEYS[2], 0, -1)
+if #pending > 0 then
+    return pending
+end
+local batch = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #batch > 0 then
+    redis.call('LTRIM', KEYS[1], #batch, -1)
+    redis.call('RPUSH', KEYS[2], unpack(batch))
+end
+return batch
+"""
+
+# 退回秒杀库存；秒杀已结束(库存键已删除)时不退回，避免重新开放抢购
+# KEYS: 库存
+# ARGV: 数量
+RESTORE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+class SeckillService:
+    """秒杀
+
+    秒杀商品的库存预先加载到Redis，抢购时由Lua脚本原子地校验限购、扣减库存并
+    发放凭证，请求不访问MySQL；订单由后台任务从队列批量取出后写入数据库。
+    """
+
+    STOCK_KEY = "seckill:stock:{item}"
+    ITEM_KEY = "seckill:item:{item}"
+    BUYERS_KEY = "seckill:buyers:{item}"
+    RESERVATION_KEY = "seckill:reservation:{token}"
+    QUEUE_KEY = "seckill:queue"
+    PROCESSING_KEY = "seckill:processing"
+
+    def __init__(self, db: Session = None):
+        self.db = db
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._take_batch = redis_client.register_script(TAKE_BATCH_SCRIPT)
+        self._restore = redis_client.register_script(RESTORE_SCRIPT)
+
+    @staticmethod
+    def item_key(product_id: int, sku_id: Optional[int] = None) -> str:
+        return f"{product_id}:{sku_id or 0}"
+
+    def load_item(self, product_id: int, sku_id: Optional[int], stock: int,
+                  price: Decimal, limit_per_user: int = 1):
+        """加载秒杀商品到Redis，库存为本次秒杀的配额"""
+        product = self.db.query(Product).get(product_id)
+        if not product:
+            raise ValueError("商品不存在")
+        sku = None
+        if sku_id:
+            sku = self.db.query(ProductSku).get(sku_id)
+            if not sku or sku.product_id != product_id:
+                raise ValueError("SKU不存在")
+
+        item = self.item_key(product_id, sku_id)
+        pipeline = redis_client.pipeline()
+        pipeline.delete(self.BUYERS_KEY.format(item=item))
+        pipeline.persist(self.ITEM_KEY.format(item=item))
+        pipeline.hset(self.ITEM_KEY.format(item=item), mapping={
+            "product_name": product.name,
+            "product_image": product.main_image_url or "",
+            "sku_attributes": (sku.attributes or "") if sku else "",
+            "price": str(price),
+            "original_price": str(sku.price if sku else product.price),
+            "limit_per_user": limit_per_user
+        })
+        pipeline.set(self.STOCK_KEY.format(item=item), stock)
+        pipeline.execute()
+        logger.info(f"Loaded seckill item {item}, stock: {stock}")
+
+    def unload_item(self, product_id: int, sku_id: Optional[int] = None):
+        """结束秒杀，之后的抢购请求直接失败
+
+        商品信息保留到队列中已抢到的订单全部生成之后再过期。
+        """
+        item = self.item_key(product_id, sku_id)
+        pipeline = redis_client.pipeline()
+        pipeline.delete(self.STOCK_KEY.format(item=item))
+        pipeline.expire(self.ITEM_KEY.format(item=item), settings.SECKILL_RESERVATION_TTL)
+        pipeline.execute()
+
+    def reserve(self, user_id: int, product_id: int, sku_id: Optional[int],
+                quantity: int, address_id: int) -> str:
+        """抢购，成功返回凭证(即订单号)"""
+        item = self.item_key(product_id, sku_id)
+        limit_per_user = redis_client.hget(self.ITEM_KEY.format(item=item), "limit_per_user")
+        if limit_per_user is None:
+            raise ValueError("秒杀活动不存在或已结束")
+        if quantity < 1 or quantity > int(limit_per_user):
+            raise ValueError("购买数量超过限购数量")
+
+        token = generate_order_no()
+        reservation = json.dumps({
+            "token": token,
+            "item": item,
+            "user_id": user_id,
+            "product_id": product_id,
+            "sku_id": sku_id,
+            "quantity": quantity,
+            "address_id": address_id
+        })
+        result = self._reserve(
+            keys=[
+                self.STOCK_KEY.format(item=item),
+                self.BUYERS_KEY.format(item=item),
+                self.QUEUE_KEY,
+                self.RESERVATION_KEY.format(token=token)
+            ],
+            args=[
+                user_id, quantity, reservation,
+                json.dumps({"status": ReservationStatus.PENDING, "user_id": user_id}),
+                settings.SECKILL_RESERVATION_TTL
+            ]
+        )
+
+        if result == -1:
+            raise ValueError("每个用户限购一次")
+        if result == -2:
+            raise ValueError("秒杀活动不存在或已结束")
+        if result == 0:
+            raise ValueError("已售罄")
+        return token
+
+    def get_reservation(self, token: str) -> Optional[dict]:
+        value = redis_client.get(self.RESERVATION_KEY.format(token=token))
+        return json.loads(value) if value else None
+
+    def materialize_orders(self, batch_size: int = None) -> dict:
+        """从队列取一批抢购结果，批量写入订单，一次提交"""
+        batch = self._take_batch(
+            keys=[self.QUEUE_KEY, self.PROCESSING_KEY],
+            args=[batch_size or settings.SECKILL_BATCH_SIZE]
+        )
+        if not batch:
+            return {"created": 0, "failed": 0}
+
+        reservations = [json.loads(entry) for entry in batch]
+
+        # 处理中队列是上次未完成的批次时，部分订单可能已经提交
+        tokens = [reservation["token"] for reservation in reservations]
+        existing = {row.order_no: (row.id, row.user_id, row.created_at) for row in self.db.query(
+            Order.order_no, Order.id, Order.user_id, Order.created_at).filter(Order.order_no.in_(tokens))}
+
+        address_ids = {reservation["address_id"] for reservation in reservations}
+        addresses = {address.id: address for address in self.db.query(
+            Address).filter(Address.id.in_(address_ids))}
+
+        items = {}
+        for item in {reservation["item"] for reservation in reservations}:
+            items[item] = redis_client.hgetall(self.ITEM_KEY.format(item=item))
+
+        orders = []
+        failed = []
+        for reservation in reservations:
+            if reservation["token"] in existing:
+                continue
+            address = addresses.get(reservation["address_id"])
+            item = items.get(reservation["item"])
+            if not address or address.user_id != reservation["user_id"] or not item:
+                failed.append(reservation)
+                continue
+            orders.append((reservation, self.build_order(reservation, item, address)))
+
+        # 按商品汇总扣减MySQL库存，库存不足时只有超出的抢购失败
+        shortages = self.deduct_stock([reservation for reservation, _ in orders])
+        created = []
+        short = []
+        for reservation, order in orders:
+            if reservation["token"] in shortages:
+                short.append(reservation)
+            else:
+                self.db.add(order)
+                created.append((reservation, order))
+
+        # 提交前取得订单ID，提交后访问属性会逐个重新加载
+        self.db.flush()
+        created = [(reservation, order.id) for reservation, order in created]
+        self.db.commit()
+
+        pipeline = redis_client.pipeline()
+        for reservation, order_id in created:
+            self._set_reservation(pipeline, reservation["token"], reservation["user_id"],
+                                  ReservationStatus.CREATED, order_id)
+        # 上次批次提交后未执行pipeline的订单也要登记，已支付或已取消的到期时会被跳过
+        OrderTimeoutService().schedule(
+            [(order_id, None) for _, order_id in created] +
+            [(order_id, created_at) for order_id, _, created_at in existing.values()], pipeline)
+        for token, (order_id, user_id, _) in existing.items():
+            self._set_reservation(pipeline, token, user_id, ReservationStatus.CREATED, order_id)
+        for reservation in failed:
+            # 退回Redis库存
+            self._restore(keys=[self.STOCK_KEY.format(item=reservation["item"])],
+                          args=[reservation["quantity"]], client=pipeline)
+        for reservation in failed + short:
+            # 数据库库存不足时Redis库存不再退回，只退回限购名额
+            pipeline.srem(self.BUYERS_KEY.format(item=reservation["item"]), reservation["user_id"])
+            self._set_reservation(pipeline, reservation["token"], reservation["user_id"],
+                                  ReservationStatus.FAILED)
+        pipeline.delete(self.PROCESSING_KEY)
+        pipeline.execute()
+
+        failed_count = len(failed) + len(short)
+        logger.info(f"Materialized seckill orders: {len(created)} created, {failed_count} failed")
+        return {"created": len(created), "failed": failed_count}
+
+    def build_order(self, reservation: dict, item: dict, address: Address) -> Order:
+        price = Decimal(item["price"])
+        total = price * reservation["quantity"]
+        order = Order(
+            order_no=reservation["token"],
+            user_id=reservation["user_id"],
+            total_amount=total,
+            payment_amount=total,
+            status=OrderStatus.PENDING_PAYMENT,
+            shipping_address_id=address.id,
+            shipping_address=(f"{address.recipient_name} {address.recipient_phone} "
+                              f"{address.province}{address.city}{address.district}{address.detailed_address}")
+        )
+        order.items.append(OrderItem(
+            product_id=reservation["product_id"],
+            sku_id=reservation["sku_id"],
+            product_name=item["product_name"],
+            product_image=item["product_image"] or None,
+            sku_attributes=item["sku_attributes"] or None,
+            price=price,
+            original_price=Decimal(item["original_price"]),
+            quantity=reservation["quantity"],
+            total_price=total
+        ))
+        return order
+
+    def deduct_stock(self, reservations: list) -> set:
+        """按商品汇总扣减库存，返回因库存不足失败的抢购凭证
+
+        汇总扣减失败时按队列顺序保留当前库存够用的抢购，只有超出的部分失败。
+        """
+        inventory = InventoryService(self.db)
+        by_item = {}
+        for reservation in reservations:
+            by_item.setdefault(reservation["item"], []).append(reservation)
+
+        shortages = set()
+        for product_id, sku_id, quantity in inventory.merge(
+                (reservation["product_id"], reservation["sku_id"], reservation["quantity"])
+                for reservation in reservations):
+            if inventory.deduct_row(product_id, sku_id, quantity):
+                continue
+
+            item = self.item_key(product_id, sku_id)
+            available = inventory.available(product_id, sku_id)
+            admitted, excess = 0, []
+            for reservation in by_item[item]:
+                if admitted + reservation["quantity"] <= available:
+                    admitted += reservation["quantity"]
+                else:
+                    excess.append(reservation)
+            if admitted and not inventory.deduct_row(product_id, sku_id, admitted):
+                # 期间库存又被其他订单扣减，本批该商品全部失败
+                excess = by_item[item]
+            logger.error(f"Seckill stock shortage in database: {item}, {len(excess)} reservations failed")
+            shortages.update(reservation["token"] for reservation in excess)
+        return shortages
+
+    def _set_reservation(self, pipeline, token: str, user_id: int, status: str, order_id: int = None):
+        value = {"status": status, "user_id": user_id}
+        if order_id is not None:
+            value["order_id"] = order_id
+        pipeline.set(self.RESERVATION_KEY.format(token=token), json.dumps(value),
+                     ex=settings.SECKILL_RESERVATION_TTL)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/16
+
+import codecs
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+from sqlalchemy import bindparam, insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.order import Order, OrderStatus
+from app.models.order_log import OrderLog
+
+# 可以发货的订单状态
+SHIPPABLE_STATUSES = (OrderStatus.PAID, OrderStatus.PENDING_SHIPMENT)
+FIELDS = ("order_no", "shipping_company", "shipping_number")
+
+
+class ShippingImportService:
+    """批量导入发货信息
+
+    上传文件逐行读取，按块校验；每块用一次IN查询定位订单，一条带状态条件的
+    executemany UPDATE写入发货信息，订单日志批量插入，每块提交一次。
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def iter_rows(stream, fmt: str) -> Iterator[Tuple[int, Optional[dict]]]:
+        """读取CSV(带表头)或NDJSON，返回(行号, 行数据)，无法解析的行数据为None"""
+        lines = codecs.iterdecode(stream, "utf-8-sig")
+        if fmt == "csv":
+            reader = csv.DictReader(lines)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+
+    def import_rows(self, rows: Iterable[Tuple[int, Optional[dict]]],
+                    operator_id: int = None, operator_name: str = None) -> dict:
+        """导入发货信息，返回成功数和逐行错误
+
+        文件中途无法读取(如非UTF-8编码、CSV格式错误)时，已读取的行照常导入后停止，
+        report["aborted"]给出原因和最后读取的行号，此前的块已经提交。
+        """
+        chunk_size = settings.SHIPPING_IMPORT_CHUNK_SIZE
+        rows = iter(rows)
+        seen = set()
+        report = {"total": 0, "shipped": 0, "errors": [], "aborted": None}
+        last_line = 0
+
+        while report["aborted"] is None:
+            chunk = []
+            try:
+                for line_no, row in islice(rows, chunk_size):
+                    chunk.append((line_no, row))
+                    last_line = line_no
+            except (UnicodeDecodeError, csv.Error) as e:
+                logger.warning(f"Shipping import aborted after line {last_line}: {str(e)}")
+                report["aborted"] = {"line": last_line, "error": f"文件读取失败: {str(e)}"}
+            if not chunk:
+                break
+            report["total"] += len(chunk)
+            valid = []
+            for line_no, row in chunk:
+                error, record = self.validate(row)
+                if not error and record["order_no"] in seen:
+                    error = "订单号重复"
+                if error:
+                    report["errors"].append({"line": line_no, "order_no": (row or {}).get("order_no"), "error": error})
+                    continue
+                seen.add(record["order_no"])
+                valid.append((line_no, record))
+
+            if valid:
+                shipped, errors = self._apply_chunk(valid, operator_id, operator_name)
+                report["shipped"] += shipped
+                report["errors"].extend(errors)
+
+        report["errors"].sort(key=lambda error: error["line"])
+        logger.info(f"Shipping import: {report['shipped']} of {report['total']} rows shipped")
+        return report
+
+    @staticmethod
+    def validate(row: Optional[dict]) -> Tuple[Optional[str], Optional[dict]]:
+        if row is None:
+            return "无法解析的行", None
+        record = {field: str(row.get(field) or "").strip() for field in FIELDS}
+        for field in FIELDS:
+            if not record[field]:
+                return f"缺少{field}", None
+        if len(record["order_no"]) > 32:
+            return "订单号格式错误", None
+        if len(record["shipping_company"]) > 50 or len(record["shipping_number"]) > 50:
+            return "物流公司或运单号过长", None
+        return None, record
+
+    def _apply_chunk(self, valid: list, operator_id: int, operator_name: str) -> Tuple[int, list]:
+        errors = []
+        orders = {row.order_no: row for row in self.db.query(
+            Order.id, Order.order_no, Order.status
+        ).filter(Order.order_no.in_([record["order_no"] for _, record in valid]))}
+
+        updates = []
+        for line_no, record in valid:
+            order = orders.get(record["order_no"])
+            if not order:
+                errors.append({"line": line_no, "order_no": record["order_no"], "error": "订单不存在"})
+            elif order.status not in SHIPPABLE_STATUSES:
+                errors.append({"line": line_no, "order_no": record["order_no"], "error": "订单状态不可发货"})
+            else:
+                updates.append((line_no, order.id, record))
+        if not updates:
+            return 0, errors
+
+        now = datetime.now().replace(microsecond=0)
+        table = Order.__table__
+        try:
+            # executemany，状态条件防止覆盖期间被取消或退款的订单
+            result = self.db.execute(
+                table.update()
+                .where(table.c.id == bindparam("b_id"), table.c.status.in_(SHIPPABLE_STATUSES))
+                .values(
+                    status=OrderStatus.SHIPPED,
+                    version=table.c.version + 1,
+                    shipping_company=bindparam("b_company"),
+                    shipping_number=bindparam("b_number"),
+                    shipping_time=now
+                ),
+                [{"b_id": order_id, "b_company": record["shipping_company"],
+                  "b_number": record["shipping_number"]} for _, order_id, record in updates]
+            )
+
+            shipped = updates
+            if result.rowcount != len(updates):
+                # 部分订单在查询后状态发生变化，找出实际更新的行
+                current = {row.id: row for row in self.db.query(
+                    Order.id, Order.status, Order.shipping_number, Order.shipping_time
+                ).filter(Order.id.in_([order_id for _, order_id, _ in updates]))}
+                shipped = []
+                for line_no, order_id, record in updates:
+                    row = current.get(order_id)
+                    if row and row.status == OrderStatus.SHIPPED and row.shipping_time == now \
+                            and row.shipping_number == record["shipping_number"]:
+                        shipped.append((line_no, order_id, record))
+                    else:
+                        errors.append({"line": line_no, "order_no": record["order_no"], "error": "订单状态不可发货"})
+
+            if shipped:
+                self.db.execute(insert(OrderLog), [{
+                    "order_id": order_id,
+                    "action": "ship",
+                    "operator_id": operator_id,
+                    "operator_type": 2,
+                    "operator_name": operator_name,
+                    "note": f"{record['shipping_company']} {record['shipping_number']}"
+                } for _, order_id, record in shipped])
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Shipping import chunk failed: {str(e)}")
+            return 0, errors + [{"line": line_no, "order_no": record["order_no"], "error": "写入失败"}
+                                for line_no, _, record in updates]
+        return len(shipped), errors
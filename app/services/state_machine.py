@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/24
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.expression import ClauseElement
+from app.core.logging import logger
+from app.models.order import Order, OrderStatus
+from app.models.payment import Payment, PaymentStatus
+
+
+class InvalidTransition(ValueError):
+    """当前状态不允许转换到目标状态"""
+
+
+class ConcurrentUpdateError(RuntimeError):
+    """多次重试后仍被并发更新抢先"""
+
+
+# 订单状态 -> 允许转换到的状态
+ORDER_TRANSITIONS = {
+    OrderStatus.SUBMITTED: {OrderStatus.PENDING_PAYMENT, OrderStatus.PAID, OrderStatus.CANCELLED},
+    OrderStatus.PENDING_PAYMENT: {OrderStatus.PAID, OrderStatus.CANCELLED},
+    OrderStatus.PAID: {OrderStatus.PENDING_SHIPMENT, OrderStatus.SHIPPED, OrderStatus.REFUNDING},
+    OrderStatus.PENDING_SHIPMENT: {OrderStatus.SHIPPED, OrderStatus.REFUNDING},
+    OrderStatus.SHIPPED: {OrderStatus.RECEIVED, OrderStatus.REFUNDING, OrderStatus.RETURNING},
+    OrderStatus.RECEIVED: {OrderStatus.COMPLETED, OrderStatus.REFUNDING, OrderStatus.RETURNING,
+                           OrderStatus.EXCHANGING},
+    OrderStatus.REFUNDING: {OrderStatus.CANCELLED, OrderStatus.COMPLETED},
+    OrderStatus.RETURNING: {OrderStatus.REFUNDING, OrderStatus.COMPLETED},
+    OrderStatus.EXCHANGING: {OrderStatus.SHIPPED, OrderStatus.COMPLETED},
+    OrderStatus.COMPLETED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
+# 支付状态 -> 允许转换到的状态
+PAYMENT_TRANSITIONS = {
+    PaymentStatus.PENDING: {PaymentStatus.SUCCESS, PaymentStatus.FAILED, PaymentStatus.CLOSED},
+    PaymentStatus.FAILED: {PaymentStatus.SUCCESS, PaymentStatus.CLOSED},
+    PaymentStatus.SUCCESS: {PaymentStatus.REFUNDED},
+    PaymentStatus.REFUNDED: set(),
+    PaymentStatus.CLOSED: set(),
+}
+
+
+class StateMachine:
+    """基于版本号的乐观并发状态转换
+
+    转换为一条 UPDATE ... WHERE id = :id AND status = :当前状态 AND version = :v，
+    不加行锁；被并发更新抢先时重新读取状态和版本号再试，已处于目标状态时直接返回False。
+    """
+
+    def __init__(self, model, transitions: dict, max_retries: int = 3):
+        self.model = model
+        self.transitions = transitions
+        self.max_retries = max_retries
+
+    def sources(self, target) -> set:
+        """可以转换到target的状态"""
+        return {source for source, targets in self.transitions.items() if target in targets}
+
+    def can_transition(self, source, target) -> bool:
+        return target in self.transitions.get(source, ())
+
+    def transition(self, db: Session, obj, target, values: dict = None, allow_same: bool = False) -> bool:
+        """把obj转换到target并写入values(不提交)
+
+        返回True表示本次完成了转换；已处于target时返回False(allow_same为True时仍写入values)。
+        当前状态不允许转换时抛出InvalidTransition。obj的属性在成功后同步为新值。
+        """
+        table = self.model.__table__
+        status, version = obj.status, obj.version
+        for _ in range(self.max_retries):
+            if status == target and not allow_same:
+                return False
+            if status != target and not self.can_transition(status, target):
+                raise InvalidTransition(
+                    f"{self.model.__name__} {obj.id}: {status.name} -> {target.name} not allowed")
+
+            params = dict(values or {})
+            result = db.execute(
+                update(table)
+                .where(table.c.id == obj.id, table.c.status == status, table.c.version == version)
+                .values(status=target, version=version + 1, **params)
+            )
+            if result.rowcount == 1:
+                set_committed_value(obj, "status", target)
+                set_committed_value(obj, "version", version + 1)
+                # values中的SQL表达式(如累加)需要重新加载
+                for key, value in params.items():
+                    if isinstance(value, ClauseElement):
+                        db.expire(obj, [key])
+                    else:
+                        set_committed_value(obj, key, value)
+                return True
+
+            # 被并发更新抢先，重新读取后再判断
+            row = db.query(table.c.status, table.c.version).filter(table.c.id == obj.id).first()
+            if row is None:
+                raise InvalidTransition(f"{self.model.__name__} {obj.id} not found")
+            status, version = row.status, row.version
+            set_committed_value(obj, "status", status)
+            set_committed_value(obj, "version", version)
+
+        logger.warning(f"{self.model.__name__} {obj.id} transition to {target.name} lost after retries")
+        raise ConcurrentUpdateError(f"{self.model.__name__} {obj.id} was updated concurrently")
+
+
+# 全局实例
+order_state = StateMachine(Order, ORDER_TRANSITIONS)
+payment_state = StateMachine(Payment, PAYMENT_TRANSITIONS)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/10
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from pypinyin import lazy_pinyin, Style
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.session import SessionLocal
+from app.models.product import Product
+
+
+def normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def suggest_keys(text: str) -> set:
+    """一个词条的前缀键：原文、全拼、拼音首字母"""
+    text = normalize(text)
+    if not text:
+        return set()
+    return {
+        text,
+        "".join(lazy_pinyin(text)).replace(" ", ""),
+        "".join(lazy_pinyin(text, style=Style.FIRST_LETTER)).replace(" ", "")
+    }
+
+
+class PrefixIndex:
+    """有序数组前缀索引
+
+    键以(key, entry_id)有序存放，前缀查找为一次二分加顺序扫描。匹配数不超过
+    scan_limit的前缀直接扫描后按权重排序；更短、匹配更多的前缀(如输入的第一个字)
+    扫描整个区间取权重最高的TOP_K个词条并缓存，词条变化时失效相关前缀的缓存。
+    """
+
+    TOP_K = 100
+    MAX_RANGE = "\U0010ffff"
+
+    def __init__(self):
+        self._keys = []  # 有序的(key, entry_id)
+        self._entries = {}  # entry_id -> (text, weight)
+        self._entry_keys = {}  # entry_id -> keys
+        self._top = {}  # 前缀 -> 按权重降序的entry_id
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def build(self, entries):
+        """全量构建，entries为(entry_id, text, weight)"""
+        keys, entry_map, entry_keys = [], {}, {}
+        for entry_id, text, weight in entries:
+            entry_map[entry_id] = (text, weight)
+            entry_keys[entry_id] = suggest_keys(text)
+            keys.extend((key, entry_id) for key in entry_keys[entry_id])
+        keys.sort()
+
+        with self._lock:
+            self._keys, self._entries, self._entry_keys = keys, entry_map, entry_keys
+            self._top = {}
+
+    def upsert(self, entry_id, text: str, weight: float):
+        keys = suggest_keys(text)
+        with self._lock:
+            self._remove(entry_id)
+            self._entries[entry_id] = (text, weight)
+            self._entry_keys[entry_id] = keys
+            for key in keys:
+                insort(self._keys, (key, entry_id))
+            self._invalidate(keys)
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def search(self, prefix: str, limit: int = 10, scan_limit: int = 500) -> list:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            entry_ids = self._top.get(prefix)
+            if entry_ids is None:
+                start = bisect_left(self._keys, (prefix,))
+                end = bisect_left(self._keys, (prefix + self.MAX_RANGE,), lo=start)
+                candidates = {entry_id for _, entry_id in self._keys[start:end]}
+                entry_ids = heapq.nlargest(
+                    self.TOP_K if end - start > scan_limit else len(candidates),
+                    candidates, key=lambda entry_id: self._entries[entry_id][1])
+                if end - start > scan_limit:
+                    self._top[prefix] = entry_ids
+            matched = [self._entries[entry_id] for entry_id in entry_ids]
+
+        results = []
+        seen = set()
+        for text, _ in matched:
+            if text not in seen:
+                seen.add(text)
+                results.append(text)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _remove(self, entry_id):
+        keys = self._entry_keys.pop(entry_id, ())
+        for key in keys:
+            i = bisect_left(self._keys, (key, entry_id))
+            if i < len(self._keys) and self._keys[i] == (key, entry_id):
+                del self._keys[i]
+        self._entries.pop(entry_id, None)
+        self._invalidate(keys)
+
+    def _invalidate(self, keys):
+        """词条的键或权重变化，失效其所有前缀的TOP_K缓存"""
+        if not self._top:
+            return
+        for key in keys:
+            for length in range(1, len(key) + 1):
+                self._top.pop(key[:length], None)
+
+
+class SuggestService:
+    """搜索联想
+
+    进程内前缀索引，词条来自上架商品名(按销量加权)和热门搜索词，
+    按products.updated_at增量刷新，常见请求不访问ES。
+    """
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self._queries = Counter()  # 上次刷新以来的搜索次数
+        self._query_weights = Counter()  # 已进入索引的搜索词累计次数
+        self._watermark = None
+        self._refreshed_at = 0
+        self._refresh_lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._refreshed_at >= settings.SUGGEST_REFRESH_INTERVAL
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        return self.index.search(prefix, limit)
+
+    def record_query(self, query: str):
+        """记录有结果的搜索词，刷新时累计次数达到SUGGEST_MIN_QUERY_COUNT的加入联想词条
+
+        待刷新的不同搜索词超过SUGGEST_MAX_PENDING_QUERIES时不再统计新词，已统计的继续计数。
+        """
+        query = normalize(query)
+        if not query:
+            return
+        if query not in self._queries and len(self._queries) >= settings.SUGGEST_MAX_PENDING_QUERIES:
+            return
+        self._queries[query] += 1
+
+    def refresh_in_background(self):
+        """在后台线程中刷新，请求不等待全量构建；构建完成前由调用方回退到ES"""
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self._refresh_with_session, name="suggest-refresh", daemon=True).start()
+
+    def _refresh_with_session(self):
+        db = SessionLocal()
+        try:
+            self.refresh(db)
+        finally:
+            db.close()
+
+    def refresh(self, db: Session):
+        """增量刷新，同一时间只有一个线程执行"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if self._watermark is None:
+                self._build(db)
+            else:
+                self._refresh_products(db)
+            self._refresh_queries()
+            self._refreshed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Suggest index refresh error: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+
+    def _build(self, db: Session):
+        watermark = db.query(Product.updated_at).order_by(Product.updated_at.desc()).limit(1).scalar()
+        rows = db.query(
+            Product.id, Product.name, Product.sold_count
+        ).filter(Product.status == 1).yield_per(settings.ES_REINDEX_FETCH_SIZE)
+        self.index.build((f"p:{row.id}", row.name, row.sold_count or 0) for row in rows)
+        self._watermark = watermark
+        logger.info(f"Built suggest index: {len(self.index)} entries")
+
+    def _refresh_products(self, db: Session):
+        # 同一秒内的变更可能晚于上次刷新提交，使用>=重复处理边界上的行
+        rows = db.query(
+            Product.id, Product.name, Product.sold_count, Product.status, Product.updated_at
+        ).filter(Product.updated_at >= self._watermark).order_by(Product.updated_at).all()
+        for row in rows:
+            if row.status == 1:
+                self.index.upsert(f"p:{row.id}", row.name, row.sold_count or 0)
+            else:
+                self.index.remove(f"p:{row.id}")
+        if rows:
+            self._watermark = rows[-1].updated_at
+
+    def _refresh_queries(self):
+        queries, self._queries = self._queries, Counter()
+        for query, count in queries.most_common(settings.SUGGEST_MAX_QUERIES):
+            self._query_weights[query] += count
+            if self._query_weights[query] >= settings.SUGGEST_MIN_QUERY_COUNT:
+                self.index.upsert(f"q:{query}", query, self._query_weights[query])
+
+        # 只保留次数最多的SUGGEST_MAX_QUERIES个搜索词
+        if len(self._query_weights) > settings.SUGGEST_MAX_QUERIES:
+            for query, _ in self._query_weights.most_common()[settings.SUGGEST_MAX_QUERIES:]:
+                del self._query_weights[query]
+                self.index.remove(f"q:{query}")
+
+
+# 全局实例
+suggest_service = SuggestService()
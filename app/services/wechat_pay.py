@@ -3,15 +3,79 @@
 # @Author: dengbanghan@gmail.com
 # @Date: 2025/5/3
 
+import csv
+import gzip
 import hashlib
+import io
 import time
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from typing import Optional, Dict
-import requests
+from typing import Optional, Dict, Iterator
 from app.core.config import settings
+from app.core.http import wechat_http, wechat_cert_http
 from app.core.logging import logger
 
+XML_HEADERS = {"Content-Type": "application/xml"}
+
+# 对账单表头 -> 字段名，其余列忽略
+BILL_COLUMNS = {
+    "交易时间": "trade_time",
+    "微信订单号": "transaction_id",
+    "商户订单号": "out_trade_no",
+    "交易类型": "trade_type",
+    "交易状态": "trade_state",
+    "应结订单金额": "settlement_total_fee",
+    "订单金额": "total_fee",
+    "微信退款单号": "refund_id",
+    "商户退款单号": "out_refund_no",
+    "退款金额": "refund_fee",
+    "退款状态": "refund_status",
+    "手续费": "fee",
+}
+BILL_SUMMARY_MARKER = "总交易单数"
+
+
+class WeChatBill:
+    """流式解析的微信对账单
+
+    迭代时逐行读取响应(按需解压gzip)，按表头映射为字典，遇到汇总行停止并把汇总
+    保存在summary中；内存占用与账单行数无关。只能迭代一次。
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.summary = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        try:
+            self.response.raw.decode_content = True
+            stream = io.BufferedReader(self.response.raw)
+            if stream.peek(2)[:2] == b"\x1f\x8b":
+                stream = gzip.GzipFile(fileobj=stream)
+            lines = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+            first = lines.readline()
+            if first.lstrip().startswith("<xml>"):
+                # 没有账单或请求错误时返回XML
+                error = ET.fromstring(first + lines.read())
+                raise ValueError(error.findtext("return_msg") or "Download bill failed")
+
+            columns = [BILL_COLUMNS.get(name.strip()) for name in next(csv.reader([first]))]
+            reader = csv.reader(lines)
+            for row in reader:
+                if not row:
+                    continue
+                if row[0].strip() == BILL_SUMMARY_MARKER:
+                    summary_row = next(reader, [])
+                    self.summary = {name.strip(): value.lstrip("`").strip()
+                                    for name, value in zip(row, summary_row)}
+                    break
+                # 账单中每个字段以`开头，防止被表格软件转换格式
+                yield {column: value.lstrip("`").strip()
+                       for column, value in zip(columns, row) if column}
+        finally:
+            self.response.close()
+
 
 class WeChatPayService:
     def __init__(self):
@@ -23,7 +87,21 @@ class WeChatPayService:
     def create_order(self, order_no: str, amount: int, desc: str,
                      client_ip: str, openid: Optional[str] = None) -> Dict:
         """创建微信支付订单"""
-        url = "https://api.mch.weixin.qq.com/pay/unifiedorder"
+        response = wechat_http.post("unifiedorder", "/pay/unifiedorder",
+                                    data=self.build_create_order(order_no, amount, desc, client_ip, openid),
+                                    headers=XML_HEADERS)
+        return self.parse_create_order(response.text)
+
+    async def create_order_async(self, order_no: str, amount: int, desc: str,
+                                 client_ip: str, openid: Optional[str] = None) -> Dict:
+        """创建微信支付订单(异步路由使用)"""
+        response = await wechat_http.post_async("unifiedorder", "/pay/unifiedorder",
+                                                data=self.build_create_order(order_no, amount, desc, client_ip, openid),
+                                                headers=XML_HEADERS)
+        return self.parse_create_order(response.text)
+
+    def build_create_order(self, order_no: str, amount: int, desc: str,
+                           client_ip: str, openid: Optional[str] = None) -> str:
         nonce_str = self.generate_nonce_str()
         params = {
             "appid": self.appid,
@@ -38,12 +116,10 @@ class WeChatPayService:
             "openid": openid
         }
         params["sign"] = self.generate_sign(params)
+        return self.dict_to_xml(params)
 
-        xml_data = self.dict_to_xml(params)
-        response = requests.post(url, data=xml_data, headers={'Content-Type': 'application/xml'})
-        response.raise_for_status()
-
-        result = self.xml_to_dict(response.text)
+    def parse_create_order(self, xml_data: str) -> Dict:
+        result = self.xml_to_dict(xml_data)
         if result.get("return_code") != "SUCCESS":
             logger.error(f"WeChat pay error: {result.get('return_msg')}")
             raise ValueError(result.get("return_msg", "WeChat pay error"))
@@ -52,7 +128,17 @@ class WeChatPayService:
 
     def query_order(self, order_no: str) -> Dict:
         """查询订单状态"""
-        url = "https://api.mch.weixin.qq.com/pay/orderquery"
+        response = wechat_http.post("orderquery", "/pay/orderquery",
+                                    data=self.build_query_order(order_no), headers=XML_HEADERS)
+        return self.xml_to_dict(response.text)
+
+    async def query_order_async(self, order_no: str) -> Dict:
+        """查询订单状态(异步路由使用)"""
+        response = await wechat_http.post_async("orderquery", "/pay/orderquery",
+                                                data=self.build_query_order(order_no), headers=XML_HEADERS)
+        return self.xml_to_dict(response.text)
+
+    def build_query_order(self, order_no: str) -> str:
         nonce_str = self.generate_nonce_str()
         params = {
             "appid": self.appid,
@@ -61,17 +147,11 @@ class WeChatPayService:
             "nonce_str": nonce_str
         }
         params["sign"] = self.generate_sign(params)
-
-        xml_data = self.dict_to_xml(params)
-        response = requests.post(url, data=xml_data, headers={'Content-Type': 'application/xml'})
-        response.raise_for_status()
-
-        return self.xml_to_dict(response.text)
+        return self.dict_to_xml(params)
 
     def refund(self, order_no: str, refund_no: str,
                total_fee: int, refund_fee: int) -> Dict:
         """申请退款"""
-        url = "https://api.mch.weixin.qq.com/secapi/pay/refund"
         nonce_str = self.generate_nonce_str()
         params = {
             "appid": self.appid,
@@ -86,14 +166,26 @@ class WeChatPayService:
         params["sign"] = self.generate_sign(params)
 
         xml_data = self.dict_to_xml(params)
-        # 需要配置证书
-        response = requests.post(url, data=xml_data,
-                                 cert=(settings.WECHAT_CERT_PATH, settings.WECHAT_KEY_PATH),
-                                 headers={'Content-Type': 'application/xml'})
-        response.raise_for_status()
+        # 需要配置证书，证书在连接池建立连接时加载
+        response = wechat_cert_http.post("refund", "/secapi/pay/refund", data=xml_data, headers=XML_HEADERS)
 
         return self.xml_to_dict(response.text)
 
+    def download_bill(self, bill_date: str, bill_type: str = "ALL") -> WeChatBill:
+        """下载对账单(bill_date为YYYYMMDD)，返回可逐行迭代的账单"""
+        params = {
+            "appid": self.appid,
+            "mch_id": self.mch_id,
+            "nonce_str": self.generate_nonce_str(),
+            "bill_date": bill_date,
+            "bill_type": bill_type,
+            "tar_type": "GZIP"
+        }
+        params["sign"] = self.generate_sign(params)
+        response = wechat_http.post("downloadbill", "/pay/downloadbill",
+                                    data=self.dict_to_xml(params), headers=XML_HEADERS, stream=True)
+        return WeChatBill(response)
+
     def process_callback(self, xml_data: str) -> Dict:
         """处理支付回调"""
         callback_data = self.xml_to_dict(xml_data)
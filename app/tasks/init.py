@@ -4,9 +4,18 @@
 # @Date: 2025/5/3
 
 from celery import Celery
+from celery.schedules import crontab
 from app.core.config import settings
 from app.db.session import SessionLocal
+from app.services.bill_reconciliation import BillReconciliationService
+from app.services.order_archive import OrderArchiveService
+from app.services.order_timeout import OrderTimeoutService
 from app.services.payment import PaymentService
+from app.services.payment_callback import PaymentCallbackService
+from app.services.reconciliation import PaymentReconciliationService
+from app.services.search import SearchService
+from app.services.seckill import SeckillService
+from app.services.search_sync import SearchSyncService
 import time
 
 celery = Celery(
@@ -25,4 +34,137 @@ def process_payment_async(self, order_id):
         # 重试逻辑
         raise self.retry(exc=e, countdown=60, max_retries=3)
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+@celery.task
+def sync_search_index():
+    """增量同步商品索引"""
+    db = SessionLocal()
+    try:
+        return SearchSyncService(db).sync_changes()
+    finally:
+        db.close()
+
+
+@celery.task
+def rebuild_search_index():
+    """零停机重建商品索引(手动触发)"""
+    db = SessionLocal()
+    try:
+        return SearchService(db).rebuild_index()
+    finally:
+        db.close()
+
+
+@celery.task
+def materialize_seckill_orders(max_batches: int = 50):
+    """把秒杀队列中的抢购结果批量写成订单"""
+    db = SessionLocal()
+    try:
+        service = SeckillService(db)
+        for _ in range(max_batches):
+            if not service.materialize_orders()["created"]:
+                break
+    finally:
+        db.close()
+
+
+@celery.task
+def cancel_expired_orders(max_batches: int = 20):
+    """取消超过支付截止时间的未支付订单"""
+    db = SessionLocal()
+    try:
+        service = OrderTimeoutService(db)
+        for _ in range(max_batches):
+            if not service.cancel_expired()["claimed"]:
+                break
+    finally:
+        db.close()
+
+
+@celery.task
+def backfill_order_deadlines():
+    """登记已有未支付订单的支付截止时间(手动触发)"""
+    db = SessionLocal()
+    try:
+        return OrderTimeoutService(db).backfill()
+    finally:
+        db.close()
+
+
+@celery.task
+def archive_orders():
+    """把过期的终态订单移到归档表"""
+    db = SessionLocal()
+    try:
+        return OrderArchiveService(db).archive()
+    finally:
+        db.close()
+
+
+@celery.task
+def consume_payment_callbacks(max_batches: int = 50):
+    """批量处理回调队列中的支付通知"""
+    db = SessionLocal()
+    try:
+        service = PaymentCallbackService(db)
+        for _ in range(max_batches):
+            if not service.consume()["received"]:
+                break
+    finally:
+        db.close()
+
+
+@celery.task
+def reconcile_payments():
+    """向支付平台查询长时间未支付的记录并更新状态"""
+    db = SessionLocal()
+    try:
+        return PaymentReconciliationService(db).run()
+    finally:
+        db.close()
+
+
+@celery.task
+def reconcile_wechat_bill(bill_date: str = None):
+    """下载微信对账单并与本地支付记录核对(默认昨天)"""
+    db = SessionLocal()
+    try:
+        return BillReconciliationService(db).reconcile(bill_date)
+    finally:
+        db.close()
+
+
+# 定时任务(celery -A app.tasks.init beat)
+celery.conf.beat_schedule = {
+    "sync-search-index": {
+        "task": sync_search_index.name,
+        "schedule": settings.SEARCH_SYNC_INTERVAL,
+    },
+    "materialize-seckill-orders": {
+        "task": materialize_seckill_orders.name,
+        "schedule": settings.SECKILL_CONSUME_INTERVAL,
+    },
+    "cancel-expired-orders": {
+        "task": cancel_expired_orders.name,
+        "schedule": settings.ORDER_TIMEOUT_INTERVAL,
+    },
+    "archive-orders": {
+        "task": archive_orders.name,
+        "schedule": settings.ORDER_ARCHIVE_INTERVAL,
+    },
+    "consume-payment-callbacks": {
+        "task": consume_payment_callbacks.name,
+        "schedule": settings.PAYMENT_CALLBACK_CONSUME_INTERVAL,
+    },
+    "reconcile-payments": {
+        "task": reconcile_payments.name,
+        "schedule": settings.PAYMENT_RECONCILE_INTERVAL,
+    },
+    # 微信次日10点后提供前一天的对账单
+    "reconcile-wechat-bill": {
+        "task": reconcile_wechat_bill.name,
+        "schedule": crontab(hour=10, minute=30),
+    },
+}
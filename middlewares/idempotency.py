@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/19
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+
+class IdempotencyMiddleware:
+    """保存带Idempotency-Key请求的响应，供重试时回放
+
+    幂等键由路由上的idempotency()依赖登记在request.state中；
+    响应状态码小于500时保存，5xx或未处理的异常则释放占位。
+    """
+
+    async def __call__(self, request: Request, call_next):
+        try:
+            response = await call_next(request)
+        except Exception:
+            key = getattr(request.state, "idempotency", None)
+            if key is not None and not key.finished:
+                await run_in_threadpool(key.release)
+            raise
+
+        key = getattr(request.state, "idempotency", None)
+        if key is None or key.finished:
+            return response
+
+        if response.status_code >= 500:
+            await run_in_threadpool(key.release)
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        await run_in_threadpool(key.complete, response.status_code, body, response.headers.get("content-type"))
+        return Response(content=body, status_code=response.status_code, headers=dict(response.headers))
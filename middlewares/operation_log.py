@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Author: dengbanghan@gmail.com
+# @Date: 2025/5/17
+
+from typing import Optional
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from app.core.audit import audit_buffer
+from app.core.security import decode_access_token
+from app.db.session import SessionLocal
+from app.models.user import User
+
+
+class OperationLogger:
+    """记录管理后台的写操作到operation_logs，经审计缓冲异步写入"""
+
+    def __init__(self, path_prefix: str = "/api/v1/admin"):
+        self.path_prefix = path_prefix
+
+    async def __call__(self, request: Request, call_next):
+        response = await call_next(request)
+
+        if request.method in ("GET", "HEAD", "OPTIONS") or not request.url.path.startswith(self.path_prefix):
+            return response
+
+        route = request.scope.get("route")
+        user = getattr(request.state, "user", None) or await self.token_user(request)
+        log_data = {
+            "operation": (route.name if route else request.url.path)[:50],
+            "method": request.method,
+            "path": request.url.path[:255],
+            "user_id": user.get("id") if isinstance(user, dict) else None,
+            "params": str(request.query_params) or None,
+            "ip": request.client.host if request.client else None,
+            "status_code": response.status_code,
+            "user_agent": (request.headers.get("user-agent") or "")[:255] or None
+        }
+        # 队列满时转到线程池等待或直接写入，不阻塞事件循环
+        if not audit_buffer.operation_log(**log_data, block=False):
+            await run_in_threadpool(audit_buffer.operation_log, **log_data)
+        return response
+
+    async def token_user(self, request: Request) -> Optional[dict]:
+        """从Bearer令牌解析操作人并保存到request.state.user
+
+        令牌中带有uid；登录时还没有写入uid的旧令牌按邮箱查询用户ID。
+        """
+        scheme, _, token = (request.headers.get("authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        payload = decode_access_token(token)
+        if not payload:
+            return None
+
+        user = {"id": payload.get("uid"), "email": payload.get("sub")}
+        if user["id"] is None and user["email"]:
+            user["id"] = await run_in_threadpool(self.user_id_by_email, user["email"])
+        request.state.user = user
+        return user
+
+    @staticmethod
+    def user_id_by_email(email: str) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            return db.query(User.id).filter(User.email == email).scalar()
+        finally:
+            db.close()